@@ -1,44 +1,63 @@
+import html
+import os
+
 import pandas as pd
 import streamlit as st
 
-from src.db import init_db, conn
+from src.db import DB_PATH, init_db, connect
+from src.queries import (
+    ROLE_LABELS, WORK_MODE_LABELS, JobFilters,
+    build_listing_query, build_summary_query, city_options,
+)
 from app_style import inject_css
 
 # ---- Page setup ----
 st.set_page_config(page_title="France Internship Finder", layout="wide")
 inject_css()
-init_db()
+
+@st.cache_resource(max_entries=1)
+def _open_db(file_key):
+    """
+    One read-only connection for every session and rerun (Streamlit runs each rerun on a new
+    thread, so a per-thread connection would be reopened every time). Migrates the schema once
+    per database file.
+    """
+    init_db()
+    return connect(readonly=True)
+
+def db():
+    """
+    The shared connection, reopened when data/jobs.sqlite is replaced (a refresh checks out a new
+    file; a handle on the old one would keep serving the old listings).
+    """
+    try:
+        st_db = os.stat(DB_PATH)
+        file_key = (st_db.st_ino, st_db.st_mtime_ns)
+    except FileNotFoundError:
+        file_key = None
+    return _open_db(file_key)
 
 st.title("🇫🇷 Internship Finder (France)")
 st.caption("Internships & Alternance • English-friendly • France")
 
-# Contract types we allow in the UI (extra safety)
-ALLOWED_CONTRACT_TYPES = {"INTERNSHIP", "ALTERNANCE", "APPRENTICESHIP"}
+PAGE_SIZE = 30      # job cards per page
+TABLE_ROWS = 500    # rows in the table under the cards
+
+CONTRACT_LABELS = {"Internship": "INTERNSHIP", "Alternance": "ALTERNANCE", "Apprenticeship": "APPRENTICESHIP"}
 
 @st.cache_data(ttl=120)
-def load_df():
-    with conn() as c:
-        return pd.read_sql_query(
-            """
-            SELECT
-                s.title,
-                s.company,
-                s.location,
-                s.url,
-                s.description,
-                g.language,
-                g.english_score,
-                g.contract_type,
-                g.is_target
-            FROM silver_jobs s
-            JOIN gold_jobs g ON g.url = s.url
-            WHERE g.is_target = 1
-              AND g.contract_type IN ('INTERNSHIP','ALTERNANCE','APPRENTICESHIP')
-            """,
-            c,
-        )
-
-df = load_df()
+def load_summary(filters: JobFilters):
+    sql, params = build_summary_query(filters)
+    return db().execute(sql, params).fetchone()
+
+@st.cache_data(ttl=120)
+def load_page(filters: JobFilters, limit: int, offset: int):
+    sql, params = build_listing_query(filters, limit, offset)
+    return pd.read_sql_query(sql, db(), params=params)
+
+@st.cache_data(ttl=120)
+def load_cities():
+    return city_options(db())
 
 # ---------- SIDEBAR ----------
 with st.sidebar:
@@ -55,79 +74,57 @@ with st.sidebar:
 
     role = st.radio(
         "Role",
-        ["All", "Data & AI", "Software", "Business", "Marketing"],
+        ["All", *ROLE_LABELS],
+    )
+
+    contracts = st.multiselect(
+        "Contract",
+        list(CONTRACT_LABELS),
+        default=list(CONTRACT_LABELS),
     )
 
     search = st.text_input("Search keywords")
 
     work_mode = st.multiselect(
         "Work mode",
-        ["Remote", "Hybrid", "On-site", "Unspecified"],
-        default=["Remote", "Hybrid", "On-site", "Unspecified"],
+        list(WORK_MODE_LABELS),
+        default=list(WORK_MODE_LABELS),
     )
 
-# ---------- FILTERING ----------
-f = df.copy()
-
-# (extra safety) remove any non-target contracts just in case
-f = f[f["contract_type"].isin(ALLOWED_CONTRACT_TYPES)]
-
-# English score filter
-f = f[f["english_score"] >= min_score]
-
-# Role filter (keyword-based)
-if role != "All":
-    role_map = {
-        "Data & AI": ["data", "ml", "machine learning", "ai", "sql", "python", "spark"],
-        "Software": ["software", "frontend", "backend", "react", "java", "node", "golang"],
-        "Business": ["business", "analyst", "consultant", "product"],
-        "Marketing": ["marketing", "seo", "growth", "communication"],
-    }
-    blob = (f["title"].fillna("") + " " + f["description"].fillna("")).str.lower()
-    mask = False
-    for k in role_map[role]:
-        mask = mask | blob.str.contains(k, na=False)
-    f = f[mask]
-
-# Free-text search
-if search.strip():
-    blob = (f["title"].fillna("") + " " + f["company"].fillna("")).str.lower()
-    f = f[blob.str.contains(search.lower(), na=False)]
-
-# Work mode filter (best-effort from location text)
-if work_mode and set(work_mode) != {"Remote", "Hybrid", "On-site", "Unspecified"}:
-    loc = f["location"].fillna("").str.lower()
-    wm_mask = False
-    if "Remote" in work_mode:
-        wm_mask = wm_mask | loc.str.contains("remote")
-    if "Hybrid" in work_mode:
-        wm_mask = wm_mask | loc.str.contains("hybrid")
-    if "On-site" in work_mode:
-        wm_mask = wm_mask | (~loc.str.contains("remote") & ~loc.str.contains("hybrid") & (loc.str.len() > 0))
-    if "Unspecified" in work_mode:
-        wm_mask = wm_mask | (loc.str.len() == 0)
-    f = f[wm_mask]
+    city = st.selectbox("City", ["All", *load_cities()])
+
+# ---------- QUERY (filtering, sorting and paging all happen in SQLite) ----------
+filters = JobFilters(
+    min_score=min_score,
+    contract_types=tuple(CONTRACT_LABELS[x] for x in contracts),
+    work_modes=tuple(WORK_MODE_LABELS[x] for x in work_mode),
+    search=search.strip(),
+    role=ROLE_LABELS.get(role),
+    city=None if city == "All" else city,
+)
+total, remote, avg_score, internships = load_summary(filters)
 
 # ---------- METRICS ----------
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("Results", len(f))
-c2.metric("Remote", int((f["location"].fillna("").str.contains("remote", case=False, na=False)).sum()))
-c3.metric("Avg EnglishScore", int(f["english_score"].mean()) if len(f) else 0)
-c4.metric("Internships", int((f["contract_type"] == "INTERNSHIP").sum()))
+c1.metric("Results", total)
+c2.metric("Remote", int(remote))
+c3.metric("Avg EnglishScore", int(avg_score))
+c4.metric("Internships", int(internships))
 
 st.divider()
 
-# Sort best-effort: newest-ish first using URL stability (no parsed_at column in DB)
-# We'll just sort by english_score desc as a proxy; you can improve later by adding timestamps.
-f_sorted = f.sort_values(["english_score"], ascending=False)
+pages = max(1, -(-total // PAGE_SIZE))
+page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+cards = load_page(filters, PAGE_SIZE, (page - 1) * PAGE_SIZE)
 
 # ---------- JOB CARDS ----------
-for _, r in f_sorted.head(30).iterrows():
+for _, r in cards.iterrows():
     st.markdown(
         f"""
         <div class="job-card">
             <div class="job-title">{r['title']}</div>
             <div class="job-meta">{r['company']} • {r['location']} • {r['contract_type']}</div>
+            <div class="job-desc">{html.escape(r['snippet'] or '')}</div>
             <div style="display:flex;gap:8px;align-items:center;">
                 <span class="badge">EnglishScore {int(r['english_score'])}</span>
                 <span class="badge">{r['language']}</span>
@@ -140,8 +137,12 @@ for _, r in f_sorted.head(30).iterrows():
 
 st.divider()
 
+table = load_page(filters, TABLE_ROWS, 0)
+if total > TABLE_ROWS:
+    st.caption(f"Top {TABLE_ROWS} of {total} results by EnglishScore")
+
 st.dataframe(
-    f_sorted[["english_score", "contract_type", "title", "company", "location", "language", "url"]],
+    table[["english_score", "contract_type", "title", "company", "location", "language", "url"]],
     use_container_width=True,
     column_config={"url": st.column_config.LinkColumn("Job link")},
 )
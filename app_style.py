@@ -122,6 +122,14 @@ div[data-testid="stDataFrame"] {
   color: var(--text);
 }
 
+.job-desc {
+  opacity: 0.8;
+  margin-bottom: 10px;
+  font-size: 13px;
+  line-height: 1.45;
+  color: var(--text);
+}
+
 .badge {
   padding: 4px 10px;
   border-radius: 999px;
@@ -0,0 +1,178 @@
+"""
+Micro-benchmarks over the real data in data/jobs.sqlite.
+
+    python bench.py parse [--limit 200]
+    python bench.py scoring [--limit 2000]
+    python bench.py langid [--limit 1000]
+"""
+import argparse
+import re
+import time
+
+from src import langid, scoring
+from src.db import conn, decode_html
+from src.wttj_silver import parse_job_fields
+
+
+def _bronze_pages(limit: int):
+    """(url, html) for up to `limit` stored job pages (hit-first JSON rows are skipped)."""
+    with conn() as c:
+        rows = c.execute("""
+            SELECT
+                b.url,
+                COALESCE(bl.body, b.html),
+                CASE WHEN bl.digest IS NULL THEN b.codec ELSE bl.codec END
+            FROM bronze_raw b
+            LEFT JOIN bronze_blobs bl ON bl.digest = b.digest
+            WHERE b.kind IS NULL
+            LIMIT ?
+        """, (limit,)).fetchall()
+    return [(url, decode_html(body, codec)) for url, body, codec in rows]
+
+
+def _timed(fn, items):
+    t0 = time.perf_counter()
+    out = [fn(x) for x in items]
+    return time.perf_counter() - t0, out
+
+
+def bench_parse(limit: int):
+    pages = _bronze_pages(limit)
+    if not pages:
+        print("[BENCH] no bronze pages in the DB")
+        return
+
+    full_s, full = _timed(lambda p: parse_job_fields(p[1], p[0], fast=False), pages)
+    fast_s, fast = _timed(lambda p: parse_job_fields(p[1], p[0], fast=True), pages)
+
+    n = len(pages)
+    mb = sum(len(h) for _, h in pages) / 1e6
+    print(f"[BENCH] parse_job_fields over {n} pages ({mb:.1f} MB html)")
+    print(f"  full : {full_s:.2f}s  {1000 * full_s / n:.1f} ms/page")
+    print(f"  fast : {fast_s:.2f}s  {1000 * fast_s / n:.1f} ms/page  (x{full_s / max(fast_s, 1e-9):.1f})")
+
+    for field in ("title", "company", "location", "contract", "description"):
+        same = sum(1 for a, b in zip(full, fast) if a[field] == b[field])
+        print(f"  {field:<12} identical: {same}/{n}")
+
+
+# --- the per-keyword / per-pattern implementation scoring.py used before the compiled matcher ---
+
+def _reference_keyword_points(t: str) -> int:
+    score = 0
+    for k in scoring.POSITIVE_EN:
+        if k in t:
+            score += 12
+    for k in scoring.POSITIVE_FR:
+        if k in t:
+            score += 12
+    for k in scoring.NEGATIVE_FR:
+        if k in t:
+            score -= 22
+    for k in scoring.TECH_BOOST:
+        if k in t:
+            score += 2
+    return score
+
+
+def _reference_match_any(patterns, text: str) -> bool:
+    for p in patterns:
+        if re.search(p, text, flags=re.IGNORECASE):
+            return True
+    return False
+
+
+def _reference_contract_type(title: str, contract: str, desc: str) -> str:
+    blob = " ".join([title or "", desc or "", contract or ""]).strip()
+    if not blob:
+        return "OTHER"
+    if _reference_match_any(scoring.NOT_TARGET_PATTERNS, blob):
+        if not (_reference_match_any(scoring.INTERNSHIP_PATTERNS, blob)
+                or _reference_match_any(scoring.ALTERNANCE_PATTERNS, blob)):
+            return "OTHER"
+    if _reference_match_any(scoring.ALTERNANCE_PATTERNS, blob):
+        return "ALTERNANCE"
+    if _reference_match_any(scoring.INTERNSHIP_PATTERNS, blob):
+        return "INTERNSHIP"
+    return "OTHER"
+
+
+def _silver_rows(limit: int):
+    with conn() as c:
+        return c.execute(
+            "SELECT title, contract, description FROM silver_jobs WHERE description IS NOT NULL LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+def bench_scoring(limit: int):
+    rows = _silver_rows(limit)
+    if not rows:
+        print("[BENCH] no silver rows in the DB")
+        return
+    texts = [(d or "").lower() for _, _, d in rows]
+
+    ref_kw_s, ref_kw = _timed(_reference_keyword_points, texts)
+    new_kw_s, new_kw = _timed(scoring.keyword_points, texts)
+    ref_ct_s, ref_ct = _timed(lambda r: _reference_contract_type(*r), rows)
+    new_ct_s, new_ct = _timed(lambda r: scoring.contract_type(*r), rows)
+
+    n = len(rows)
+    print(f"[BENCH] scoring over {n} silver rows")
+    print(f"  keywords     : {ref_kw_s:.3f}s -> {new_kw_s:.3f}s (x{ref_kw_s / max(new_kw_s, 1e-9):.1f})"
+          f"  identical {sum(a == b for a, b in zip(ref_kw, new_kw))}/{n}")
+    print(f"  contract_type: {ref_ct_s:.3f}s -> {new_ct_s:.3f}s (x{ref_ct_s / max(new_ct_s, 1e-9):.1f})"
+          f"  identical {sum(a == b for a, b in zip(ref_ct, new_ct))}/{n}")
+
+
+def bench_langid(limit: int):
+    """Throughput of each language backend, and agreement with langdetect (the reference) on fr/en."""
+    rows = _silver_rows(limit)
+    samples = [scoring._language_sample(d) for _, _, d in rows if d and len(d) >= 60]
+    if not samples:
+        print("[BENCH] no silver descriptions in the DB")
+        return
+
+    results = {}
+    print(f"[BENCH] language identification over {len(samples)} silver descriptions")
+    for name in langid.LANGUAGE_BACKENDS:
+        t0 = time.perf_counter()
+        langid.identify(samples[0], backend=name)  # first call includes lazy imports / profile loading
+        first_s = time.perf_counter() - t0
+        secs, out = _timed(lambda t: langid.identify(t, backend=name), samples)
+        results[name] = out
+        print(f"  {name:<11} first call {1000 * first_s:7.1f} ms   {len(samples) / max(secs, 1e-9):8.0f} docs/s")
+
+    ref = results["langdetect"]
+    judged = [i for i, lang in enumerate(ref) if lang in ("fr", "en")]
+    for name, out in results.items():
+        if name == "langdetect" or not judged:
+            continue
+        agree = sum(1 for i in judged if out[i] == ref[i])
+        print(f"  {name:<11} agrees with langdetect on {agree}/{len(judged)} fr/en docs ({100 * agree / len(judged):.1f}%)")
+
+
+def main():
+    p = argparse.ArgumentParser(description="benchmarks on data/jobs.sqlite")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("parse", help="fast vs full parse_job_fields")
+    sp.add_argument("--limit", type=int, default=200)
+
+    sp = sub.add_parser("scoring", help="compiled matcher vs per-keyword scans (must be identical)")
+    sp.add_argument("--limit", type=int, default=2000)
+
+    sp = sub.add_parser("langid", help="language backends: throughput + agreement with langdetect")
+    sp.add_argument("--limit", type=int, default=1000)
+
+    args = p.parse_args()
+    if args.cmd == "parse":
+        bench_parse(args.limit)
+    elif args.cmd == "scoring":
+        bench_scoring(args.limit)
+    elif args.cmd == "langid":
+        bench_langid(args.limit)
+
+
+if __name__ == "__main__":
+    main()
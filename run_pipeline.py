@@ -1,108 +1,539 @@
-from src.db import init_db, conn
-from src.wttj_bronze import wttj_list_urls_france, fetch
-from src.wttj_silver import parse_job_fields
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from src.db import (
+    init_db, conn, connect, checkpoint_wal, rebuild_fts, refresh_app_jobs, decode_html, put_blob, BatchWriter,
+    iter_batches, get_checkpoint, set_checkpoint, clear_checkpoint,
+)
+from src.wttj_bronze import wttj_list_urls_france, wttj_list_hits_france, fetch_many
+from src.wttj_silver import parse_job_fields, parse_hit_fields, hit_needs_page
 from src.gold_features import compute_gold
+from src.scoring import scoring_version
+from src.queries import PLAN_CHECKS, check_query_plans
+from src.langid import LANGUAGE_BACKENDS, set_language_backend, get_language_backend
 
 
-def bronze_ingest():
-    urls = wttj_list_urls_france(limit=400, max_pages=40, per_page=50, debug=True)
-    print(f"[BRONZE] discovered urls: {len(urls)}")
+def _urls_to_fetch(c, urls, refetch_after_hours=None):
+    """
+    Pre-fetch dedup: keep only URLs that are not in bronze_raw yet, or whose copy was last
+    checked more than `refetch_after_hours` ago (None = never re-fetch). One set-based query
+    for the whole batch. Returns [(url, etag, last_modified, known)] in discovery order,
+    known = already has a bronze row.
+    """
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS discovered_urls (url TEXT PRIMARY KEY)")
+    c.execute("DELETE FROM discovered_urls")
+    c.executemany("INSERT OR IGNORE INTO discovered_urls(url) VALUES (?)", [(u,) for u in urls])
 
-    new = 0
-    with conn() as c:
-        for url in urls:
+    max_age = f"-{float(refetch_after_hours)} hours" if refetch_after_hours is not None else None
+    wanted = {
+        u: (etag, last_modified, bool(known))
+        for u, etag, last_modified, known in c.execute("""
+            SELECT d.url, b.etag, b.last_modified, b.url IS NOT NULL
+            FROM discovered_urls d
+            LEFT JOIN bronze_raw b ON b.url = d.url
+            WHERE b.url IS NULL
+               OR (? IS NOT NULL AND COALESCE(b.checked_at, b.fetched_at) < datetime('now', ?))
+        """, (max_age, max_age))
+    }
+    c.execute("DELETE FROM discovered_urls")
+
+    # keep discovery order
+    return [(u, *wanted[u]) for u in urls if u in wanted]
+
+
+def _ingest_hits(c, pairs):
+    """
+    Hit-first mode: store Algolia hits whose content is complete enough as bronze bodies
+    (kind='algolia_hit'), so those jobs need no page fetch. Returns (urls that still need their page, stored).
+    """
+    need_page = []
+    # never replace a fetched job page with the (poorer) hit payload, and leave unchanged hits alone:
+    # both count as ignored
+    with BatchWriter(c, """
+        INSERT INTO bronze_raw(url, source, digest, kind, checked_at)
+        VALUES (?, ?, ?, 'algolia_hit', datetime('now'))
+        ON CONFLICT(url) DO UPDATE SET
+            digest = excluded.digest,
+            fetched_at = datetime('now'),
+            checked_at = excluded.checked_at
+        WHERE bronze_raw.kind = 'algolia_hit'
+          AND bronze_raw.digest IS NOT excluded.digest
+    """) as hits:
+        for url, hit in pairs:
+            if hit is None or hit_needs_page(parse_hit_fields(hit, url)):
+                need_page.append(url)
+                continue
             try:
-                html = fetch(url)
-                c.execute(
-                    "INSERT OR IGNORE INTO bronze_raw(url, source, html) VALUES (?, ?, ?)",
-                    (url, "wttj", html),
-                )
-                if c.total_changes > 0:
-                    new += 1
+                digest = put_blob(c, json.dumps(hit, sort_keys=True, ensure_ascii=False))
             except Exception:
+                need_page.append(url)
                 continue
+            hits.add((url, "wttj", digest))
+    return need_page, hits.written
 
-    print(f"[BRONZE] new pages: {new}")
 
+def bronze_ingest(
+    fetch_workers: int = 8,
+    per_host_rps: float = 5.0,
+    refetch_after_hours=None,
+    hit_first: bool = False,
+    write_batch: int = 200,
+):
+    if hit_first:
+        pairs = wttj_list_hits_france(limit=400, max_pages=40, per_page=50, debug=True)
+        urls = [u for u, _ in pairs]
+    else:
+        urls = wttj_list_urls_france(limit=400, max_pages=40, per_page=50, debug=True)
+    print(f"[BRONZE] discovered urls: {len(urls)}")
 
-def silver_transform():
-    new = 0
     errors = 0
-
     with conn() as c:
-        rows = c.execute("""
-            SELECT b.url, b.source, b.html
-            FROM bronze_raw b
-            LEFT JOIN silver_jobs s ON s.url = b.url
-            WHERE s.url IS NULL
-        """).fetchall()
-
-        for url, source, html in rows:
-            try:
-                # ✅ FIX: pass url as 2nd argument
-                f = parse_job_fields(html, url)
-
-                c.execute("""
-                    INSERT OR REPLACE INTO silver_jobs
-                    (url, source, title, company, location, contract, description)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    url,
-                    source,
-                    f.get("title"),
-                    f.get("company"),
-                    f.get("location"),
-                    f.get("contract"),
-                    f.get("description"),
-                ))
-                new += 1
-            except Exception:
-                errors += 1
-                continue
+        if hit_first:
+            urls, from_hits = _ingest_hits(c, pairs)
+            print(f"[BRONZE] stored from hits: {from_hits} (need page: {len(urls)})")
+
+        todo = _urls_to_fetch(c, urls, refetch_after_hours=refetch_after_hours)
+        validators = {u: (etag, lm) for u, etag, lm, _ in todo if etag or lm}
+        known = {u for u, _, _, k in todo if k}
+        fresh = len(urls) - len(todo)
+        print(f"[BRONZE] to fetch (new or stale): {len(todo)} (skipped={fresh}, revalidating={len(validators)})")
+
+        # one writer per statement; each flush commits, so an interrupted run keeps what it downloaded
+        opts = dict(batch_size=write_batch, commit=True)
+        new_pages = BatchWriter(c, """
+            INSERT OR IGNORE INTO bronze_raw(url, source, digest, etag, last_modified, checked_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+        """, **opts)
+        # stale URL picked for re-fetch -> point at the (possibly new) body
+        refetched = BatchWriter(c, """
+            UPDATE bronze_raw
+            SET html = NULL, codec = NULL, kind = NULL,
+                digest = ?, etag = ?, last_modified = ?,
+                fetched_at = datetime('now'), checked_at = datetime('now')
+            WHERE url = ?
+        """, **opts)
+        # still valid: keep the body (and fetched_at, so silver won't re-parse), just mark it checked
+        not_modified = BatchWriter(c, """
+            UPDATE bronze_raw
+            SET etag = ?, last_modified = ?, checked_at = datetime('now')
+            WHERE url = ?
+        """, **opts)
+
+        # pages are downloaded concurrently; all writes stay on this thread's connection
+        results = fetch_many(
+            [u for u, _, _, _ in todo],
+            workers=fetch_workers,
+            per_host_rps=per_host_rps,
+            validators=validators,
+        )
+        with new_pages, refetched, not_modified:
+            for url, res in results:
+                if res is None:
+                    errors += 1
+                    continue
+                try:
+                    if res.status == 304:
+                        not_modified.add((res.etag, res.last_modified, url))
+                    elif url in known:
+                        refetched.add((put_blob(c, res.html), res.etag, res.last_modified, url))
+                    else:
+                        new_pages.add((url, "wttj", put_blob(c, res.html), res.etag, res.last_modified))
+                except Exception:
+                    errors += 1
+                    continue
 
-    print(f"[SILVER] parsed: {new} (errors={errors})")
+        # bodies no URL points at any more (page content changed)
+        c.execute("""
+            DELETE FROM bronze_blobs
+            WHERE digest NOT IN (SELECT digest FROM bronze_raw WHERE digest IS NOT NULL)
+        """)
 
+    downloaded = new_pages.written + refetched.written
+    print(f"[BRONZE] new pages: {new_pages.written} (already stored: {new_pages.ignored}), refetched: {refetched.written}")
+    print(f"[BRONZE] cache: hit={fresh} 304={not_modified.written} miss={downloaded} errors={errors}")
 
-def gold_compute():
-    new = 0
+
+@contextmanager
+def _mapper(workers: int, initializer=None, initargs=()):
+    """map() for a pipeline stage: builtin map for 1 worker, otherwise an ordered process-pool map."""
+    if workers <= 1:
+        yield map
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as ex:
+        yield lambda fn, items: ex.map(fn, items, chunksize=max(1, len(items) // (workers * 4)))
+
+
+def _parse_row(row):
+    """Silver worker (runs in a pool process): bronze row -> silver_jobs tuple, or None on error."""
+    url, source, html, codec, digest, kind = row
+    try:
+        body = decode_html(html, codec)
+        if kind == "algolia_hit":
+            f = parse_hit_fields(json.loads(body), url)
+        else:
+            # ✅ FIX: pass url as 2nd argument
+            f = parse_job_fields(body, url)
+    except Exception:
+        return None
+    return (
+        url,
+        source,
+        f.get("title"),
+        f.get("company"),
+        f.get("location"),
+        f.get("contract"),
+        f.get("description"),
+        digest,
+    )
+
+
+# a real UPDATE on conflict (not REPLACE's delete + insert), so the jobs_fts triggers see it
+SILVER_UPSERT = """
+    INSERT INTO silver_jobs (url, source, title, company, location, contract, description, digest)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(url) DO UPDATE SET
+        source = excluded.source,
+        title = excluded.title,
+        company = excluded.company,
+        location = excluded.location,
+        contract = excluded.contract,
+        description = excluded.description,
+        digest = excluded.digest,
+        parsed_at = datetime('now')
+"""
+
+
+def _run_stage(
+    c,
+    stage: str,
+    select_sql: str,
+    worker,
+    upsert_sql: str,
+    workers: int,
+    chunk_size: int,
+    params: tuple = (),
+    initializer=None,
+    initargs=(),
+):
+    """
+    Generic streaming stage: walk `select_sql` in keyset batches, map `worker` over each batch
+    (process pool when workers > 1), upsert the non-None results as one BatchWriter batch, and commit
+    together with a checkpoint of the last key. An interrupted run resumes after that key;
+    rows before it are picked up by the next run's anti-join. Returns (written, errors, rows/sec).
+    """
     errors = 0
+    t0 = time.perf_counter()
+    start = get_checkpoint(c, stage)
+    if start:
+        print(f"[{stage.upper()}] resuming after checkpoint: {start}")
 
+    # flushed explicitly per batch, so the rows land in the same transaction as their checkpoint
+    writer = BatchWriter(c, upsert_sql, batch_size=chunk_size, max_seconds=None)
+    with _mapper(workers, initializer, initargs) as pmap:
+        for rows in iter_batches(c, select_sql, params, batch_size=chunk_size, start_after=start):
+            out = [r for r in pmap(worker, rows) if r is not None]
+            errors += len(rows) - len(out)
+
+            writer.add_many(out)
+            writer.flush()
+            set_checkpoint(c, stage, rows[-1][0])
+            c.commit()
+
+    clear_checkpoint(c, stage)
+    c.commit()
+    done = writer.written
+    elapsed = time.perf_counter() - t0
+    return done, errors, (done + errors) / elapsed if elapsed > 0 else 0.0
+
+
+def silver_transform(workers: int = 1, chunk_size: int = 100):
     with conn() as c:
-        rows = c.execute("""
-            SELECT s.url, s.title, s.contract, s.description
-            FROM silver_jobs s
-            LEFT JOIN gold_jobs g ON g.url = s.url
-            WHERE g.url IS NULL
-        """).fetchall()
-
-        for url, title, contract, description in rows:
-            try:
-                g = compute_gold(title, contract, description)
-                c.execute("""
-                    INSERT OR REPLACE INTO gold_jobs
-                    (url, language, english_score, contract_type, is_target)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    url,
-                    g.get("language"),
-                    g.get("english_score"),
-                    g.get("contract_type"),
-                    g.get("is_target"),
-                ))
-                new += 1
-            except Exception:
-                errors += 1
-                continue
+        # only URLs whose body digest differs from the one silver was parsed from;
+        # parsing (decompression included) runs in the pool, this process is the only writer
+        new, errors, rate = _run_stage(
+            c,
+            "silver",
+            """
+                SELECT
+                    b.url,
+                    b.source,
+                    COALESCE(bl.body, b.html),
+                    CASE WHEN bl.digest IS NULL THEN b.codec ELSE bl.codec END,
+                    b.digest,
+                    b.kind
+                FROM bronze_raw b
+                LEFT JOIN bronze_blobs bl ON bl.digest = b.digest
+                LEFT JOIN silver_jobs s ON s.url = b.url
+                WHERE (s.url IS NULL OR s.digest IS NOT b.digest)
+                  AND b.url > ?
+                ORDER BY b.url
+                LIMIT ?
+            """,
+            _parse_row,
+            SILVER_UPSERT,
+            workers,
+            chunk_size,
+        )
+
+    print(f"[SILVER] parsed: {new} (errors={errors}) {rate:.1f} rows/s")
+
+
+def _gold_row(row):
+    """Gold worker: silver row -> gold_jobs tuple, or None on error."""
+    url, title, contract, description, location, digest = row
+    try:
+        g = compute_gold(title, contract, description, location)
+    except Exception:
+        return None
+    return (
+        url,
+        g.get("language"),
+        g.get("english_score"),
+        g.get("contract_type"),
+        g.get("is_target"),
+        g.get("work_mode"),
+        g.get("role_category"),
+        g.get("city"),
+        digest,
+        scoring_version(),
+    )
+
+
+def gold_compute(workers: int = 1, chunk_size: int = 100):
+    version = scoring_version()
+    with conn() as c:
+        # new/changed silver rows, plus rows scored under older rules; each batch is upserted in
+        # place, so readers keep seeing the previous scores until that batch commits
+        new, errors, rate = _run_stage(
+            c,
+            "gold",
+            """
+                SELECT s.url, s.title, s.contract, s.description, s.location, s.digest
+                FROM silver_jobs s
+                LEFT JOIN gold_jobs g ON g.url = s.url
+                WHERE (g.url IS NULL OR g.digest IS NOT s.digest OR g.scoring_version IS NOT ?)
+                  AND s.url > ?
+                ORDER BY s.url
+                LIMIT ?
+            """,
+            _gold_row,
+            """
+                INSERT OR REPLACE INTO gold_jobs
+                (url, language, english_score, contract_type, is_target,
+                 work_mode, role_category, city, digest, scoring_version, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            """,
+            workers,
+            chunk_size,
+            params=(version,),
+            # pool processes must score with the same language backend as this one
+            initializer=set_language_backend,
+            initargs=(get_language_backend(),),
+        )
+
+    print(f"[GOLD] computed: {new} (errors={errors}) {rate:.1f} rows/s, scoring version {version}")
+
+
+def app_jobs_refresh():
+    """Final stage: copy new/re-scored target jobs into app_jobs and drop the ones no longer targeted."""
+    with conn() as c:
+        upserted, removed = refresh_app_jobs(c)
+        total = c.execute("SELECT COUNT(*) FROM app_jobs").fetchone()[0]
+    print(f"[APP] refreshed: {upserted} removed: {removed} (app jobs: {total})")
+
+
+def _silver_size(c) -> float:
+    return c.execute("SELECT COALESCE(SUM(length(CAST(description AS BLOB))), 0) FROM silver_jobs").fetchone()[0] / 1e6
+
+
+def backfill_descriptions(workers: int = 1, chunk_size: int = 100):
+    """
+    Re-parse every stored job page with the current parser (boilerplate-free descriptions),
+    regardless of digest, then queue the affected gold rows for re-scoring.
+    Resumable through the "silver_backfill" checkpoint.
+    """
+    with conn() as c:
+        before = _silver_size(c)
+        new, errors, rate = _run_stage(
+            c,
+            "silver_backfill",
+            """
+                SELECT
+                    b.url,
+                    b.source,
+                    COALESCE(bl.body, b.html),
+                    CASE WHEN bl.digest IS NULL THEN b.codec ELSE bl.codec END,
+                    b.digest,
+                    b.kind
+                FROM bronze_raw b
+                LEFT JOIN bronze_blobs bl ON bl.digest = b.digest
+                WHERE b.kind IS NULL
+                  AND b.url > ?
+                ORDER BY b.url
+                LIMIT ?
+            """,
+            _parse_row,
+            SILVER_UPSERT,
+            workers,
+            chunk_size,
+        )
+        # gold keys off the digest, which a re-parse doesn't change -> reset it explicitly
+        c.execute("""
+            UPDATE gold_jobs SET digest = NULL
+            WHERE url IN (SELECT url FROM bronze_raw WHERE kind IS NULL)
+        """)
+        after = _silver_size(c)
+
+    print(f"[SILVER] backfilled: {new} (errors={errors}) {rate:.1f} rows/s, description bytes: {before:.1f} MB -> {after:.1f} MB")
+
+
+def _bronze_size_report(c, label: str):
+    n, inline_bytes = c.execute(
+        "SELECT COUNT(*), COALESCE(SUM(length(CAST(html AS BLOB))), 0) FROM bronze_raw"
+    ).fetchone()
+    blobs, blob_bytes = c.execute(
+        "SELECT COUNT(*), COALESCE(SUM(length(body)), 0) FROM bronze_blobs"
+    ).fetchone()
+    page_size = c.execute("PRAGMA page_size").fetchone()[0]
+    page_count = c.execute("PRAGMA page_count").fetchone()[0]
+    print(
+        f"[BRONZE] {label}: rows={n} blobs={blobs} html={(inline_bytes + blob_bytes) / 1e6:.1f} MB "
+        f"db={page_size * page_count / 1e6:.1f} MB"
+    )
+
+
+def compress_bronze(batch_size: int = 200):
+    """
+    One-off migration: move legacy inline bronze html (plain or compressed) into the compressed,
+    content-addressed bronze_blobs table, then VACUUM so the file shrinks.
+    Silver/gold rows built from those pages inherit the digest, so nothing gets re-parsed.
+    """
+    done = 0
+    with conn() as c:
+        _bronze_size_report(c, "before")
+        while True:
+            rows = c.execute(
+                "SELECT url, html, codec FROM bronze_raw WHERE html IS NOT NULL LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for url, html, codec in rows:
+                updates.append((put_blob(c, decode_html(html, codec)), url))
+            c.executemany("UPDATE bronze_raw SET html = NULL, codec = NULL, digest = ? WHERE url = ?", updates)
+            c.commit()
+            done += len(rows)
+
+        c.execute("""
+            UPDATE silver_jobs
+            SET digest = (SELECT b.digest FROM bronze_raw b WHERE b.url = silver_jobs.url)
+            WHERE digest IS NULL
+        """)
+        c.execute("""
+            UPDATE gold_jobs
+            SET digest = (SELECT s.digest FROM silver_jobs s WHERE s.url = gold_jobs.url)
+            WHERE digest IS NULL
+        """)
+
+    _vacuum()
+    with conn() as c:
+        _bronze_size_report(c, "after")
+    print(f"[BRONZE] migrated rows: {done}")
+
+
+def _vacuum():
+    """Rebuild the file so freed pages are dropped (the DB is committed to git as a whole)."""
+    c = connect()
+    try:
+        c.execute("VACUUM")
+        # VACUUM may renumber app_jobs rowids, which the full-text index is keyed on
+        rebuild_fts(c)
+        c.commit()
+    finally:
+        c.close()
+
+
+def check_plans():
+    failures = check_query_plans(conn())
+    for name, problems in failures.items():
+        print(f"[PLANS] ❌ {name}: {'; '.join(problems)}")
+    if failures:
+        sys.exit(1)
+    print(f"[PLANS] ✅ {len(PLAN_CHECKS)} app queries use indexes")
+
 
-    print(f"[GOLD] computed: {new} (errors={errors})")
+def parse_args():
+    p = argparse.ArgumentParser(description="WTTJ bronze -> silver -> gold pipeline")
+    p.add_argument("--fetch-workers", type=int, default=8, help="concurrent job-page downloads")
+    p.add_argument("--per-host-rps", type=float, default=5.0, help="max requests/second per host (0 = unlimited)")
+    p.add_argument(
+        "--refetch-after-hours", type=float, default=None,
+        help="re-download pages whose bronze copy is older than this (default: never)",
+    )
+    p.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="processes for the CPU-bound silver parsing and gold scoring stages (1 = in-process)",
+    )
+    p.add_argument("--chunk-size", type=int, default=100, help="rows read, parsed and written per batch")
+    p.add_argument(
+        "--lang-backend", choices=sorted(LANGUAGE_BACKENDS), default=None,
+        help="language identification backend for gold scoring (default: $LANGID_BACKEND or langdetect)",
+    )
+    p.add_argument(
+        "--hit-first", action="store_true",
+        help="build records from Algolia hits; fetch job pages only when the hit description is missing/truncated",
+    )
+    p.add_argument(
+        "--backfill-descriptions", action="store_true",
+        help="re-parse all stored pages into boilerplate-free descriptions, re-score gold, VACUUM, then exit",
+    )
+    p.add_argument(
+        "--check-plans", action="store_true",
+        help="EXPLAIN the app's main queries; exit non-zero if any falls back to a full scan or sort, then exit",
+    )
+    p.add_argument(
+        "--compress-bronze", action="store_true",
+        help="one-off: move existing bronze html into compressed, deduplicated blobs, VACUUM, print sizes, then exit",
+    )
+    return p.parse_args()
 
 
 def main():
+    args = parse_args()
+    if args.lang_backend:
+        set_language_backend(args.lang_backend)
     init_db()
-    bronze_ingest()
-    silver_transform()
-    gold_compute()
-    print("✅ Pipeline completed.")
+    try:
+        if args.check_plans:
+            check_plans()
+            return
+        if args.compress_bronze:
+            compress_bronze()
+            return
+        if args.backfill_descriptions:
+            backfill_descriptions(workers=args.workers, chunk_size=args.chunk_size)
+            gold_compute(workers=args.workers, chunk_size=args.chunk_size)
+            app_jobs_refresh()
+            _vacuum()
+            return
+        bronze_ingest(
+            fetch_workers=args.fetch_workers,
+            per_host_rps=args.per_host_rps,
+            refetch_after_hours=args.refetch_after_hours,
+            hit_first=args.hit_first,
+        )
+        silver_transform(workers=args.workers, chunk_size=args.chunk_size)
+        gold_compute(workers=args.workers, chunk_size=args.chunk_size)
+        app_jobs_refresh()
+        print("✅ Pipeline completed.")
+    finally:
+        # data/jobs.sqlite is committed on its own, so nothing may be left in the -wal file
+        checkpoint_wal()
 
 
 if __name__ == "__main__":
@@ -1,46 +1,562 @@
+import hashlib
+import os
 import sqlite3
+import threading
+import time
+import zlib
 from pathlib import Path
+from typing import Optional, Tuple, Union
+
+try:
+    import zstandard  # optional, only needed to read/write "zstd" rows
+except ImportError:
+    zstandard = None
 
 DB_PATH = Path("data/jobs.sqlite")
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-def conn():
-    return sqlite3.connect(DB_PATH)
+# Codec for newly written bronze html. zlib is stdlib, so every environment can decode it.
+BRONZE_CODEC = "zlib"
 
-def init_db():
-    with conn() as c:
-        c.execute("""
+# ---------------------------
+# connections
+# ---------------------------
+
+# Applied to every connection. WAL is set once on the file (it persists) by the first writer.
+# With WAL, readers see the last committed snapshot and never block the writer (or vice versa);
+# synchronous=NORMAL is safe in WAL mode (an OS crash can only lose the latest commits).
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -64000,           # negative = KiB -> ~64 MB page cache
+    "mmap_size": 256 * 1024 * 1024,  # read pages straight from the OS page cache
+    "temp_store": "MEMORY",          # sorts / temp b-trees (ORDER BY, GROUP BY, temp tables)
+    "busy_timeout": 5000,            # ms to wait for another writer instead of failing at once
+}
+
+_local = threading.local()
+
+def connect(readonly: bool = False) -> sqlite3.Connection:
+    """
+    New tuned connection. readonly=True opens the file with mode=ro (used by the app): it can never
+    take the write lock, so it can't get in the pipeline's way. Such a connection may be shared
+    across threads (the app keeps one for all sessions and reruns; sqlite serializes the calls).
+    """
+    if readonly:
+        c = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        c = sqlite3.connect(DB_PATH)
+        c.execute("PRAGMA journal_mode = WAL")
+    for name, value in CONNECTION_PRAGMAS.items():
+        c.execute(f"PRAGMA {name} = {value}")
+    return c
+
+def conn() -> sqlite3.Connection:
+    """
+    This thread's reusable read-write connection (opened on first use). `with conn() as c:` commits
+    or rolls back on exit but leaves the connection open for the next caller on the same thread.
+    """
+    cached = getattr(_local, "rw", None)
+    # a forked worker process must not share its parent's sqlite handle
+    if cached is None or cached[0] != os.getpid():
+        cached = _local.rw = (os.getpid(), connect())
+    return cached[1]
+
+def checkpoint_wal():
+    """Fold the WAL back into the main file, e.g. before the file is committed to git."""
+    conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+# ---------------------------
+# bronze html compression
+# ---------------------------
+
+def encode_html(html: str, codec: str = BRONZE_CODEC) -> Tuple[Union[str, bytes], Optional[str]]:
+    """html -> (value to store in bronze_raw.html, codec). codec None means plain TEXT."""
+    raw = html.encode("utf-8")
+    if codec == "zlib":
+        return zlib.compress(raw, 9), "zlib"
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=19).compress(raw), "zstd"
+    return html, None
+
+def decode_html(value: Union[str, bytes, None], codec: Optional[str]) -> str:
+    """Inverse of encode_html; rows written before compression have codec NULL and TEXT html."""
+    if value is None:
+        return ""
+    if not codec:
+        return value if isinstance(value, str) else bytes(value).decode("utf-8", "replace")
+    if codec == "zlib":
+        return zlib.decompress(value).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("bronze row is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(value).decode("utf-8")
+    raise ValueError(f"unknown bronze codec: {codec}")
+
+def content_digest(html: str) -> str:
+    """sha256 of the page body; identical bodies share one bronze_blobs row."""
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+def put_blob(c, html: str) -> str:
+    """Store html once in the content-addressed bronze_blobs table and return its digest."""
+    digest = content_digest(html)
+    if c.execute("SELECT 1 FROM bronze_blobs WHERE digest = ?", (digest,)).fetchone() is None:
+        body, codec = encode_html(html)
+        c.execute(
+            "INSERT OR IGNORE INTO bronze_blobs(digest, codec, body, size) VALUES (?, ?, ?, ?)",
+            (digest, codec, body, len(html)),
+        )
+    return digest
+
+# ---------------------------
+# Algolia credentials cache
+# ---------------------------
+
+def load_algolia_config(ttl_hours: float) -> Optional[Tuple[str, str, str]]:
+    """(app_id, api_key, index) resolved by an earlier run, if younger than ttl_hours."""
+    try:
+        with conn() as c:
+            row = c.execute("""
+                SELECT app_id, api_key, index_name
+                FROM algolia_config
+                WHERE id = 1 AND resolved_at >= datetime('now', ?)
+            """, (f"-{float(ttl_hours)} hours",)).fetchone()
+    except sqlite3.Error:
+        return None
+    return tuple(row) if row else None
+
+def save_algolia_config(app_id: str, api_key: str, index: str):
+    try:
+        with conn() as c:
+            c.execute("""
+                INSERT OR REPLACE INTO algolia_config(id, app_id, api_key, index_name, resolved_at)
+                VALUES (1, ?, ?, ?, datetime('now'))
+            """, (app_id, api_key, index))
+    except sqlite3.Error:
+        pass
+
+def clear_algolia_config():
+    try:
+        with conn() as c:
+            c.execute("DELETE FROM algolia_config")
+    except sqlite3.Error:
+        pass
+
+# ---------------------------
+# streaming reads + resumable checkpoints
+# ---------------------------
+
+def iter_batches(c, sql: str, params: tuple = (), batch_size: int = 100, start_after: str = ""):
+    """
+    Keyset-paginated cursor walk: yields lists of at most batch_size rows.
+    `sql` must end with `<key> > ? ... ORDER BY <key> LIMIT ?` and select the key as its first column.
+    Each batch is a fresh bounded query, so writes between batches are safe.
+    """
+    last = start_after
+    while True:
+        rows = c.execute(sql, (*params, last, batch_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+def get_checkpoint(c, stage: str) -> str:
+    row = c.execute("SELECT last_key FROM pipeline_checkpoints WHERE stage = ?", (stage,)).fetchone()
+    return row[0] if row else ""
+
+def set_checkpoint(c, stage: str, last_key: str):
+    c.execute("""
+        INSERT INTO pipeline_checkpoints(stage, last_key, updated_at) VALUES (?, ?, datetime('now'))
+        ON CONFLICT(stage) DO UPDATE SET last_key = excluded.last_key, updated_at = excluded.updated_at
+    """, (stage, last_key))
+
+def clear_checkpoint(c, stage: str):
+    c.execute("DELETE FROM pipeline_checkpoints WHERE stage = ?", (stage,))
+
+# ---------------------------
+# batched writes
+# ---------------------------
+
+class BatchWriter:
+    """
+    Buffers rows for one INSERT/UPDATE statement and writes them with a single executemany once
+    `batch_size` rows are pending or `max_seconds` have passed since the first one (checked on add),
+    and on flush() / leaving the `with` block. Counts come from each executemany's rowcount, so rows
+    skipped by OR IGNORE, a false ON CONFLICT ... WHERE or an UPDATE matching nothing are `ignored`.
+    """
+
+    def __init__(self, c, sql: str, batch_size: int = 500, max_seconds: Optional[float] = 5.0, commit: bool = False):
+        self.c = c
+        self.sql = sql
+        self.batch_size = batch_size
+        self.max_seconds = max_seconds
+        self.commit = commit  # commit after every flush (otherwise the caller owns the transaction)
+        self.written = 0
+        self.ignored = 0
+        self.batches = 0
+        self._rows = []
+        self._first_at = 0.0
+
+    def add(self, row: tuple):
+        if not self._rows:
+            self._first_at = time.monotonic()
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size or (
+            self.max_seconds is not None and time.monotonic() - self._first_at >= self.max_seconds
+        ):
+            self.flush()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self) -> Tuple[int, int]:
+        """Write pending rows now; returns (written, ignored) for this batch."""
+        if not self._rows:
+            return 0, 0
+        rows, self._rows = self._rows, []
+        written = self.c.executemany(self.sql, rows).rowcount
+        ignored = len(rows) - written
+        self.written += written
+        self.ignored += ignored
+        self.batches += 1
+        if self.commit:
+            self.c.commit()
+        return written, ignored
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+def _add_column(c, table: str, column: str, decl: str):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column already exists (older DBs)."""
+    cols = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+# html is only set for legacy rows; new rows point at bronze_blobs through digest
+BRONZE_RAW_DDL = """
         CREATE TABLE IF NOT EXISTS bronze_raw (
             url TEXT PRIMARY KEY,
             source TEXT NOT NULL,
-            html TEXT NOT NULL,
+            html TEXT,
             fetched_at TEXT DEFAULT (datetime('now'))
         );
-        """)
+        """
+
+def _relax_bronze_html(c):
+    """
+    bronze_raw.html used to be NOT NULL; bodies now live in bronze_blobs, so it must accept NULL.
+    SQLite can't drop a constraint in place -> rebuild the table once.
+    """
+    info = {row[1]: row for row in c.execute("PRAGMA table_info(bronze_raw)")}
+    if not info["html"][3]:  # notnull flag
+        return
+    cols = ", ".join(info)
+    c.execute("ALTER TABLE bronze_raw RENAME TO bronze_raw_old")
+    c.execute(BRONZE_RAW_DDL)
+    for name, row in info.items():
+        if name not in {"url", "source", "html", "fetched_at"}:
+            c.execute(f"ALTER TABLE bronze_raw ADD COLUMN {name} {row[2]}")
+    c.execute(f"INSERT INTO bronze_raw({cols}) SELECT {cols} FROM bronze_raw_old")
+    c.execute("DROP TABLE bronze_raw_old")
+
+# Full-text index for the app's search box over app_jobs title/company (external content: the text
+# itself stays in app_jobs). Kept in sync by triggers, which refresh_app_jobs' upserts and deletes
+# fire; unicode61 + remove_diacritics so "equipe" finds "équipe".
+JOBS_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+        title, company,
+        content = 'app_jobs',
+        content_rowid = 'rowid',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_jobs_fts_ai AFTER INSERT ON app_jobs BEGIN
+        INSERT INTO jobs_fts(rowid, title, company)
+        VALUES (new.rowid, new.title, new.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_jobs_fts_ad AFTER DELETE ON app_jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, title, company)
+        VALUES ('delete', old.rowid, old.title, old.company);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_jobs_fts_au AFTER UPDATE OF title, company ON app_jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, title, company)
+        VALUES ('delete', old.rowid, old.title, old.company);
+        INSERT INTO jobs_fts(rowid, title, company)
+        VALUES (new.rowid, new.title, new.company);
+    END
+    """,
+)
+
+# triggers of every earlier jobs_fts layout (it first indexed silver_jobs)
+_JOBS_FTS_TRIGGERS = (
+    "silver_jobs_fts_ai", "silver_jobs_fts_ad", "silver_jobs_fts_au",
+    "app_jobs_fts_ai", "app_jobs_fts_ad", "app_jobs_fts_au",
+)
 
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS silver_jobs (
+def _create_jobs_fts(c):
+    # one statement at a time: executescript() would commit the migration's transaction midway
+    for statement in JOBS_FTS_DDL:
+        c.execute(statement)
+
+def _recreate_jobs_fts(c):
+    """Drop jobs_fts in whatever layout it has, create the current one and index app_jobs into it."""
+    for trigger in _JOBS_FTS_TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    c.execute("DROP TABLE IF EXISTS jobs_fts")
+    _create_jobs_fts(c)
+    rebuild_fts(c)
+
+def rebuild_fts(c):
+    """Re-index jobs_fts from app_jobs (after VACUUM renumbers the rowids it is keyed on)."""
+    c.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")
+
+# ---------------------------
+# schema migrations
+# ---------------------------
+
+def _migration_baseline(c):
+    """
+    Everything init_db used to do before versioned migrations. Idempotent, so it also brings any
+    pre-migration DB (user_version 0, some of these tables/columns already present) up to date.
+    """
+    c.execute(BRONZE_RAW_DDL)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bronze_blobs (
+        digest TEXT PRIMARY KEY,
+        codec TEXT,
+        body BLOB NOT NULL,
+        size INTEGER
+    );
+    """)
+
+    # last key committed by an interrupted stage run; cleared when the stage finishes
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+        stage TEXT PRIMARY KEY,
+        last_key TEXT NOT NULL,
+        updated_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    # single-row cache of the resolved Algolia credentials + working index
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS algolia_config (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        app_id TEXT NOT NULL,
+        api_key TEXT NOT NULL,
+        index_name TEXT NOT NULL,
+        resolved_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS silver_jobs (
+        url TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        title TEXT,
+        company TEXT,
+        location TEXT,
+        contract TEXT,
+        description TEXT,
+        parsed_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS gold_jobs (
+        url TEXT PRIMARY KEY,
+        language TEXT,
+        english_score INTEGER,
+        contract_type TEXT,
+        is_target INTEGER,
+        computed_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    # HTTP validators for conditional re-checks; checked_at = last time the copy was confirmed fresh
+    _add_column(c, "bronze_raw", "etag", "TEXT")
+    _add_column(c, "bronze_raw", "last_modified", "TEXT")
+    _add_column(c, "bronze_raw", "checked_at", "TEXT")
+    # html holds a compressed BLOB when codec is set (see encode_html)
+    _add_column(c, "bronze_raw", "codec", "TEXT")
+    _relax_bronze_html(c)
+
+    # content digests drive incremental processing: silver/gold only re-run when these change
+    _add_column(c, "bronze_raw", "digest", "TEXT")
+    _add_column(c, "silver_jobs", "digest", "TEXT")
+    _add_column(c, "gold_jobs", "digest", "TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bronze_digest ON bronze_raw(digest);")
+
+    # fingerprint of the scoring rules a gold row was computed with (src.scoring.scoring_version)
+    _add_column(c, "gold_jobs", "scoring_version", "TEXT")
+
+    # precomputed app filters (src.gold_features.compute_gold), matched with equality predicates
+    _add_column(c, "gold_jobs", "work_mode", "TEXT")
+    _add_column(c, "gold_jobs", "role_category", "TEXT")
+    _add_column(c, "gold_jobs", "city", "TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gold_work_mode ON gold_jobs(work_mode);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gold_role ON gold_jobs(role_category);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gold_city ON gold_jobs(city);")
+
+    # body format: NULL = job page html, 'algolia_hit' = JSON hit payload (hit-first ingestion)
+    _add_column(c, "bronze_raw", "kind", "TEXT")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_gold_score ON gold_jobs(english_score);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_silver_loc ON silver_jobs(location);")
+
+    # the search box's full-text index (jobs_fts) is created by the later migrations
+
+def _migration_app_indexes(c):
+    """
+    Covering index for the app listing (src.queries.build_listing_query): target gold rows walked
+    in english_score DESC, url order (no sort pass, LIMIT stops early) with every filter column in
+    the index; silver is then looked up through its url primary key.
+    """
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_gold_app
+        ON gold_jobs(is_target, english_score DESC, url, contract_type, work_mode, role_category, city, language)
+    """)
+    # superseded by idx_gold_app
+    c.execute("DROP INDEX IF EXISTS idx_gold_score")
+
+# ---------------------------
+# app_jobs: what the Streamlit app reads
+# ---------------------------
+
+# contract types the app shows; only these gold rows are materialized
+APP_CONTRACT_TYPES = ("INTERNSHIP", "ALTERNANCE", "APPRENTICESHIP")
+
+# characters of the description kept as the card snippet
+APP_SNIPPET_CHARS = 280
+
+def refresh_app_jobs(c) -> Tuple[int, int]:
+    """
+    Bring app_jobs in line with gold/silver: upsert target jobs whose gold row was (re)computed
+    since they were copied (gold_computed_at differs), delete the ones no longer targeted.
+    Returns (upserted, removed).
+    """
+    types = ", ".join("?" * len(APP_CONTRACT_TYPES))
+    upserted = c.execute(f"""
+        INSERT INTO app_jobs (
+            url, title, company, location, city, contract_type, language, english_score,
+            work_mode, role_category, snippet, gold_computed_at
+        )
+        SELECT
+            g.url, s.title, s.company, s.location, g.city, g.contract_type, g.language, g.english_score,
+            g.work_mode, g.role_category,
+            substr(s.description, 1, ?) || CASE WHEN length(s.description) > ? THEN '…' ELSE '' END,
+            g.computed_at
+        FROM gold_jobs g
+        JOIN silver_jobs s ON s.url = g.url
+        LEFT JOIN app_jobs a ON a.url = g.url
+        WHERE g.is_target = 1
+          AND g.contract_type IN ({types})
+          AND (a.url IS NULL OR a.gold_computed_at IS NOT g.computed_at)
+        ON CONFLICT(url) DO UPDATE SET
+            title = excluded.title,
+            company = excluded.company,
+            location = excluded.location,
+            city = excluded.city,
+            contract_type = excluded.contract_type,
+            language = excluded.language,
+            english_score = excluded.english_score,
+            work_mode = excluded.work_mode,
+            role_category = excluded.role_category,
+            snippet = excluded.snippet,
+            gold_computed_at = excluded.gold_computed_at
+    """, (APP_SNIPPET_CHARS, APP_SNIPPET_CHARS, *APP_CONTRACT_TYPES)).rowcount
+    removed = c.execute(f"""
+        DELETE FROM app_jobs
+        WHERE url NOT IN (
+            SELECT url FROM gold_jobs WHERE is_target = 1 AND contract_type IN ({types})
+        )
+    """, APP_CONTRACT_TYPES).rowcount
+    return upserted, removed
+
+def _migration_app_jobs(c):
+    """
+    Denormalized, compact copy of what the app shows (display fields, snippet, filter columns),
+    maintained by the pipeline's last stage (refresh_app_jobs), so the app never touches the large
+    silver description column or joins at read time.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS app_jobs (
             url TEXT PRIMARY KEY,
-            source TEXT NOT NULL,
             title TEXT,
             company TEXT,
             location TEXT,
-            contract TEXT,
-            description TEXT,
-            parsed_at TEXT DEFAULT (datetime('now'))
-        );
-        """)
-
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS gold_jobs (
-            url TEXT PRIMARY KEY,
+            city TEXT,
+            contract_type TEXT,
             language TEXT,
             english_score INTEGER,
-            contract_type TEXT,
-            is_target INTEGER,
-            computed_at TEXT DEFAULT (datetime('now'))
+            work_mode TEXT,
+            role_category TEXT,
+            snippet TEXT,
+            gold_computed_at TEXT
         );
-        """)
+    """)
+    # listing order + the filter columns, so filtered pages and the summary read only the index
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_app_listing
+        ON app_jobs(english_score DESC, url, contract_type, work_mode, role_category, city)
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_app_role ON app_jobs(role_category);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_app_city ON app_jobs(city);")
+    refresh_app_jobs(c)
+
+def _migration_fts_without_description(c):
+    """Re-create jobs_fts over title/company only (it used to index descriptions too)."""
+    _recreate_jobs_fts(c)
+
+def _migration_app_reads_app_jobs(c):
+    """
+    The app reads only app_jobs: move jobs_fts onto app_jobs (search no longer goes through
+    silver_jobs) and drop the gold indexes whose only reader was the app's old gold/silver listing
+    (refresh_app_jobs reads gold by is_target/contract_type and url).
+    """
+    _recreate_jobs_fts(c)
+    for index in ("idx_gold_app", "idx_gold_work_mode", "idx_gold_role", "idx_gold_city"):
+        c.execute(f"DROP INDEX IF EXISTS {index}")
 
-        c.execute("CREATE INDEX IF NOT EXISTS idx_gold_score ON gold_jobs(english_score);")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_silver_loc ON silver_jobs(location);")
+# Applied in order; PRAGMA user_version = number of migrations applied. Append only, never reorder.
+MIGRATIONS = [
+    _migration_baseline,
+    _migration_app_indexes,
+    _migration_app_jobs,
+    _migration_fts_without_description,
+    _migration_app_reads_app_jobs,
+]
+
+def migrate(c) -> int:
+    """
+    Apply pending MIGRATIONS, each in one transaction together with its version bump (an explicit
+    BEGIN, since sqlite3 would run DDL in autocommit mode). Returns the new version.
+    """
+    c.commit()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        c.execute("BEGIN")
+        try:
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+    return len(MIGRATIONS)
+
+def init_db():
+    with conn() as c:
+        migrate(c)
@@ -1,13 +1,19 @@
-from src.scoring import detect_language, english_score, contract_type, is_target
+from src.scoring import (
+    detect_language, english_score, contract_type, is_target,
+    work_mode, role_category, normalize_city,
+)
 
-def compute_gold(title: str, contract: str, description: str) -> dict:
+def compute_gold(title: str, contract: str, description: str, location: str = "") -> dict:
     lang = detect_language(description)
-    score = english_score(description)
+    score = english_score(description, lang=lang)
     ctype = contract_type(title, contract, description)
     target = is_target(ctype)
     return {
         "language": lang,
         "english_score": score,
         "contract_type": ctype,
-        "is_target": target
+        "is_target": target,
+        "work_mode": work_mode(location, description),
+        "role_category": role_category(title, description),
+        "city": normalize_city(location),
     }
@@ -0,0 +1,107 @@
+import os
+import re
+from typing import Callable, Dict, Optional
+
+# Seed for langdetect, which is randomised (None = langdetect's default non-deterministic behaviour)
+LANGDETECT_SEED = 0
+
+# ---------------------------
+# langdetect (reference, slow to import and per call)
+# ---------------------------
+
+_langdetect = None
+
+def _langdetect_backend(text: str) -> str:
+    global _langdetect
+    if _langdetect is None:
+        # imported on first use: loading its language profiles is the slow part
+        import langdetect
+        if LANGDETECT_SEED is not None:
+            langdetect.DetectorFactory.seed = LANGDETECT_SEED
+        _langdetect = langdetect
+    try:
+        return _langdetect.detect(text)
+    except _langdetect.LangDetectException:
+        return "unknown"
+
+# ---------------------------
+# stopwords: compact offline fr/en model
+# ---------------------------
+
+# Function words are the most frequent tokens of each language and rarely appear in the other,
+# which is all we need to tell French from English job ads.
+FR_WORDS = frozenset("""
+    le la les des du de un une et est sont au aux en dans pour par sur avec sans vous nous votre
+    notre vos nos ce cette ces qui que quoi dont où il elle ils elles leur leurs son sa ses mais
+    ou donc car ne pas plus très être avoir fait chez entre comme aussi tout tous toute toutes
+""".split())
+
+# no word that is also common French ("il a", "on recherche", "tu as", "un an")
+EN_WORDS = frozenset("""
+    the and is are was were be been of to in at for with without by from you we our
+    your they their it its this that these those who which what will would can could should
+    not but or if about into more very have has had do does all also any
+""".split())
+
+# elided articles/pronouns: l'équipe, d'une, qu'il
+FR_ELISION_HEADS = frozenset(("l", "d", "qu", "n", "s", "c", "j", "m", "t"))
+
+_WORD_RE = re.compile(r"[a-zàâäçéèêëîïôöùûüœ']+")
+
+# below this many function-word hits the text is too short/odd to call
+STOPWORDS_MIN_HITS = 5
+
+def _stopwords_backend(text: str) -> str:
+    fr = en = 0
+    for w in _WORD_RE.findall(text.lower()):
+        if "'" in w:
+            head = w.split("'", 1)[0]
+            if head in FR_ELISION_HEADS:
+                fr += 1
+                continue
+        if w in FR_WORDS:
+            fr += 1
+        elif w in EN_WORDS:
+            en += 1
+    if fr + en < STOPWORDS_MIN_HITS:
+        return "unknown"
+    return "fr" if fr > en else "en"
+
+# ---------------------------
+# registry
+# ---------------------------
+
+LANGUAGE_BACKENDS: Dict[str, Callable[[str], str]] = {
+    "langdetect": _langdetect_backend,
+    "stopwords": _stopwords_backend,
+}
+
+# what decides each backend's answer (src.scoring hashes it into the scoring version)
+BACKEND_RULES: Dict[str, Callable[[], object]] = {
+    "langdetect": lambda: {"seed": LANGDETECT_SEED},
+    "stopwords": lambda: {
+        "fr": sorted(FR_WORDS),
+        "en": sorted(EN_WORDS),
+        "elisions": sorted(FR_ELISION_HEADS),
+        "min_hits": STOPWORDS_MIN_HITS,
+    },
+}
+
+_backend_name = os.environ.get("LANGID_BACKEND", "langdetect")
+
+def set_language_backend(name: str):
+    global _backend_name
+    if name not in LANGUAGE_BACKENDS:
+        raise ValueError(f"unknown language backend {name!r} (choose from {', '.join(LANGUAGE_BACKENDS)})")
+    _backend_name = name
+
+def get_language_backend() -> str:
+    return _backend_name
+
+def backend_rules(name: str) -> object:
+    """JSON-serialisable rules of a backend: when they change, its past answers are stale."""
+    return BACKEND_RULES[name]()
+
+def identify(text: str, backend: Optional[str] = None) -> str:
+    """Language code of text ("fr", "en", ... or "unknown") using the selected backend."""
+    return LANGUAGE_BACKENDS[backend or _backend_name](text)
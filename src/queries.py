@@ -0,0 +1,161 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.db import APP_CONTRACT_TYPES
+
+# ---------------------------
+# full-text search (jobs_fts, see src.db)
+# ---------------------------
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def search_match(search: str) -> Optional[str]:
+    """Search box -> MATCH over title + company: every word must appear, the last one as a prefix."""
+    words = _TOKEN_RE.findall((search or "").lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return "{title company} : (" + " AND ".join(terms) + ")"
+
+# ---------------------------
+# app listing: sidebar state -> one parameterized query over app_jobs
+# ---------------------------
+
+# UI label -> precomputed value (src.scoring.work_mode / role_category)
+WORK_MODE_LABELS = {"Remote": "REMOTE", "Hybrid": "HYBRID", "On-site": "ONSITE", "Unspecified": "UNSPECIFIED"}
+ROLE_LABELS = {"Data & AI": "DATA_AI", "Software": "SOFTWARE", "Business": "BUSINESS", "Marketing": "MARKETING"}
+
+# display columns only (snippet is the short, precomputed start of the description)
+LISTING_COLUMNS = """
+    a.url,
+    a.title,
+    a.company,
+    a.location,
+    a.language,
+    a.english_score,
+    a.contract_type,
+    a.work_mode,
+    a.city,
+    a.snippet
+"""
+
+class JobFilters(NamedTuple):
+    min_score: int = 0
+    contract_types: Tuple[str, ...] = APP_CONTRACT_TYPES
+    work_modes: Tuple[str, ...] = tuple(WORK_MODE_LABELS.values())
+    search: str = ""
+    role: Optional[str] = None   # app_jobs.role_category
+    city: Optional[str] = None   # app_jobs.city
+
+def _where(f: JobFilters) -> Tuple[str, list]:
+    clauses = []
+    params: list = []
+
+    # app_jobs only holds target contracts; narrow further to the selected ones
+    types = [t for t in f.contract_types if t in APP_CONTRACT_TYPES]
+    if not types:
+        clauses.append("0")
+    elif len(types) < len(APP_CONTRACT_TYPES):
+        clauses.append(f"a.contract_type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+
+    if f.min_score:
+        clauses.append("a.english_score >= ?")
+        params.append(int(f.min_score))
+
+    # nothing or everything selected = no filter
+    modes = sorted(set(f.work_modes) & set(WORK_MODE_LABELS.values()))
+    if modes and len(modes) < len(WORK_MODE_LABELS):
+        clauses.append(f"a.work_mode IN ({', '.join('?' * len(modes))})")
+        params.extend(modes)
+
+    if f.role:
+        clauses.append("a.role_category = ?")
+        params.append(f.role)
+
+    if f.city:
+        clauses.append("a.city = ?")
+        params.append(f.city)
+
+    match = search_match(f.search)
+    if match is not None:
+        clauses.append("a.rowid IN (SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ?)")
+        params.append(match)
+
+    return " AND ".join(clauses) or "1", params
+
+def build_listing_query(f: JobFilters, limit: int, offset: int = 0) -> Tuple[str, list]:
+    """(sql, params) for one page of matching jobs, best EnglishScore first (url keeps pages stable)."""
+    where, params = _where(f)
+    sql = f"""
+        SELECT {LISTING_COLUMNS}
+        FROM app_jobs a
+        WHERE {where}
+        ORDER BY a.english_score DESC, a.url
+        LIMIT ? OFFSET ?
+    """
+    return sql, params + [int(limit), int(offset)]
+
+def build_summary_query(f: JobFilters) -> Tuple[str, list]:
+    """(sql, params) for the metric row: results, remote, average score, internships."""
+    where, params = _where(f)
+    sql = f"""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(a.work_mode = 'REMOTE'), 0),
+            COALESCE(AVG(a.english_score), 0),
+            COALESCE(SUM(a.contract_type = 'INTERNSHIP'), 0)
+        FROM app_jobs a
+        WHERE {where}
+    """
+    return sql, params
+
+def city_options(c, limit: int = 50) -> List[str]:
+    """Most common cities in the app, for the city filter."""
+    rows = c.execute("""
+        SELECT city
+        FROM app_jobs
+        WHERE city IS NOT NULL
+        GROUP BY city
+        ORDER BY COUNT(*) DESC, city
+        LIMIT ?
+    """, (int(limit),))
+    return [city for (city,) in rows]
+
+# ---------------------------
+# query-plan regression check
+# ---------------------------
+
+# the app's main queries, with filter combinations that must all stay index-driven
+PLAN_CHECKS = {
+    "listing (default filters)": lambda: build_listing_query(JobFilters(), 30, 0),
+    "listing (min score + role + city)": lambda: build_listing_query(
+        JobFilters(min_score=40, role="DATA_AI", city="Paris"), 30, 0
+    ),
+    "listing (work mode + search)": lambda: build_listing_query(
+        JobFilters(work_modes=("REMOTE", "HYBRID"), search="data"), 30, 30
+    ),
+    "summary (default filters)": lambda: build_summary_query(JobFilters()),
+}
+
+def plan_problems(c, sql: str, params) -> List[str]:
+    """
+    EXPLAIN QUERY PLAN lines that mean a full table scan, or a sort over a scan (every row sorted
+    before LIMIT applies). Sorting the few rows an index SEARCH found is fine.
+    """
+    details = [row[3] for row in c.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    scans = [d for d in details if d.startswith("SCAN ") and "VIRTUAL TABLE" not in d]
+    problems = [d for d in scans if " USING " not in d]
+    if scans:
+        problems += [d for d in details if "TEMP B-TREE FOR ORDER BY" in d]
+    return problems
+
+def check_query_plans(c) -> Dict[str, List[str]]:
+    """{query name: problems} for every PLAN_CHECKS query that regressed (empty dict = all good)."""
+    failures = {}
+    for name, build in PLAN_CHECKS.items():
+        sql, params = build()
+        problems = plan_problems(c, sql, params)
+        if problems:
+            failures[name] = problems
+    return failures
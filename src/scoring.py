@@ -1,5 +1,16 @@
-from langdetect import detect, LangDetectException
+import hashlib
+import json
 import re
+from functools import lru_cache
+from typing import Optional
+
+from src.langid import identify, get_language_backend, backend_rules
+
+# Bump when scoring *code* changes in a way the rule lists below don't capture
+SCORING_CODE_VERSION = 2
+
+# Language is detected on at most this many characters (head, middle and tail of the text)
+LANG_SAMPLE_CHARS = 1500
 
 # Internship / alternance signals (EN+FR)
 INTERNSHIP_PATTERNS = [
@@ -52,21 +63,84 @@ NEGATIVE_FR = [
     "uniquement en français", "uniquement en francais"
 ]
 
+# Small boost for tech stack mentions
+TECH_BOOST = ["sql", "python", "spark", "databricks", "aws", "gcp", "azure", "docker", "kubernetes", "power bi"]
+
+def _language_sample(text: str, max_chars: int = LANG_SAMPLE_CHARS) -> str:
+    """Bounded, representative slice of text: equal parts from the start, middle and end."""
+    if len(text) <= max_chars:
+        return text
+    part = max_chars // 3
+    mid = (len(text) - part) // 2
+    return " ".join([text[:part], text[mid:mid + part], text[-part:]])
+
 def detect_language(text: str) -> str:
+    """Language of text via the backend selected in src.langid (langdetect unless configured)."""
     if not text or len(text) < 60:
         return "unknown"
-    try:
-        return detect(text)
-    except LangDetectException:
-        return "unknown"
+    return identify(_language_sample(text))
+
+# ---------------------------
+# Keyword signal matcher
+# ---------------------------
+
+# signal group -> (keywords, points per keyword found)
+SIGNAL_GROUPS = {
+    "positive_en": (POSITIVE_EN, 12),
+    "positive_fr": (POSITIVE_FR, 12),
+    "negative_fr": (NEGATIVE_FR, -22),
+    "tech": (TECH_BOOST, 2),
+}
+
+def _build_anchor_index(groups):
+    """
+    Group every keyword under one of its words (the one shared by most keywords, 4+ chars).
+    A keyword can only occur if its anchor does, so one substring check on "anglais" rules out
+    all eleven "... anglais" phrases at once. Exact: same result as checking each keyword.
+    """
+    words = list(dict.fromkeys(k for ks, _ in groups.values() for k in ks))
+    tokens = {k: re.findall(r"\w+", k) for k in words}
+    freq = {}
+    for ts in tokens.values():
+        for w in set(ts):
+            freq[w] = freq.get(w, 0) + 1
 
-def english_score(text: str) -> int:
+    index = {}
+    for k in words:
+        cands = [w for w in tokens[k] if len(w) >= 4] or tokens[k] or [k]
+        anchor = max(cands, key=lambda w: (freq.get(w, 0), len(w)))
+        index.setdefault(anchor, []).append(k)
+    return index
+
+_ANCHOR_INDEX = _build_anchor_index(SIGNAL_GROUPS)
+
+def match_signals(t: str) -> dict:
+    """Per-group keywords present in the (already lowercased) text."""
+    found = set()
+    for anchor, ks in _ANCHOR_INDEX.items():
+        if anchor in t:
+            for k in ks:
+                if k in t:
+                    found.add(k)
+    return {g: [k for k in ks if k in found] for g, (ks, _) in SIGNAL_GROUPS.items()}
+
+def keyword_points(t: str) -> int:
+    """Score contribution of the keyword signals (same as one `k in t` check per keyword)."""
+    hits = match_signals(t)
+    return sum(points * len(hits[g]) for g, (_, points) in SIGNAL_GROUPS.items())
+
+def english_score(text: str, lang: Optional[str] = None) -> int:
+    """
+    0-100 English-friendliness. Pass `lang` when detect_language(text) was already run
+    (as compute_gold does) to avoid detecting the language twice.
+    """
     if not text:
         return 0
     t = text.lower()
     score = 0
 
-    lang = detect_language(text)
+    if lang is None:
+        lang = detect_language(text)
     if lang == "en":
         score += 55
     elif lang == "fr":
@@ -74,28 +148,36 @@ def english_score(text: str) -> int:
     else:
         score += 5
 
-    for k in POSITIVE_EN:
-        if k in t:
-            score += 12
-    for k in POSITIVE_FR:
-        if k in t:
-            score += 12
-    for k in NEGATIVE_FR:
-        if k in t:
-            score -= 22
-
-    tech_boost = ["sql", "python", "spark", "databricks", "aws", "gcp", "azure", "docker", "kubernetes", "power bi"]
-    for k in tech_boost:
-        if k in t:
-            score += 2
+    score += keyword_points(t)
 
     return max(0, min(100, score))
 
-def _match_any(patterns, text: str) -> bool:
-    for p in patterns:
-        if re.search(p, text, flags=re.IGNORECASE):
-            return True
-    return False
+# contract category -> one compiled alternation of its patterns
+CONTRACT_GROUPS = {
+    "not_target": NOT_TARGET_PATTERNS,
+    "alternance": ALTERNANCE_PATTERNS,
+    "internship": INTERNSHIP_PATTERNS,
+}
+
+_CONTRACT_RES = {g: re.compile("|".join(f"(?:{p})" for p in ps), re.IGNORECASE) for g, ps in CONTRACT_GROUPS.items()}
+
+# any category can start here; scanned once, then each candidate position is checked per category
+_CONTRACT_ANY_RE = re.compile(
+    "(?=" + "|".join(f"(?:{p})" for ps in CONTRACT_GROUPS.values() for p in ps) + ")",
+    re.IGNORECASE,
+)
+
+def contract_signals(blob: str) -> set:
+    """Contract categories with at least one match in blob, in a single scan."""
+    found = set()
+    for m in _CONTRACT_ANY_RE.finditer(blob):
+        pos = m.start()
+        for g, rx in _CONTRACT_RES.items():
+            if g not in found and rx.match(blob, pos):
+                found.add(g)
+        if len(found) == len(_CONTRACT_RES):
+            break
+    return found
 
 def contract_type(title: str, contract: str, desc: str) -> str:
     # Use title+desc as primary (more reliable than "contract" field)
@@ -103,18 +185,155 @@ def contract_type(title: str, contract: str, desc: str) -> str:
     if not blob:
         return "OTHER"
 
+    found = contract_signals(blob)
+
     # If explicitly CDI/CDD/full-time only, not a target
-    if _match_any(NOT_TARGET_PATTERNS, blob):
+    if "not_target" in found:
         # BUT: allow if it also clearly says stage/alternance (some postings mention CDI after internship)
-        if not (_match_any(INTERNSHIP_PATTERNS, blob) or _match_any(ALTERNANCE_PATTERNS, blob)):
+        if not ("internship" in found or "alternance" in found):
             return "OTHER"
 
-    if _match_any(ALTERNANCE_PATTERNS, blob):
+    if "alternance" in found:
         return "ALTERNANCE"
-    if _match_any(INTERNSHIP_PATTERNS, blob):
+    if "internship" in found:
         return "INTERNSHIP"
 
     return "OTHER"
 
 def is_target(ct: str) -> int:
     return 1 if ct in ("INTERNSHIP", "ALTERNANCE") else 0
+
+# ---------------------------
+# Work mode / role / city (precomputed filter columns)
+# ---------------------------
+
+# checked in this order; the first mode with a match wins
+WORK_MODE_PATTERNS = {
+    "REMOTE": [
+        r"\bfull[\s-]?remote\b",
+        r"\bfully remote\b",
+        r"\bremote[\s-]first\b",
+        r"\b100\s?%\s?(?:remote|t[ée]l[ée]travail)\b",
+        r"\bt[ée]l[ée]travail (?:total|complet|int[ée]gral)\b",
+    ],
+    "HYBRID": [
+        r"\bhybrid\b",
+        r"\bhybride\b",
+        r"\bt[ée]l[ée]travail (?:partiel|possible|occasionnel)\b",
+        r"\b\d\s?(?:jours?|days?) (?:de |of |per week |par semaine )?(?:t[ée]l[ée]travail|remote)\b",
+        r"\bremote (?:days?|possible|friendly)\b",
+    ],
+    "ONSITE": [
+        r"\bon[\s-]?site\b",
+        r"\bsur site\b",
+        r"\b100\s?%\s?pr[ée]sentiel\b",
+    ],
+}
+
+# remote work ruled out -> ONSITE, checked before everything else ("pas de télétravail possible"
+# would otherwise read as HYBRID)
+NO_REMOTE_PATTERNS = [
+    r"\bno remote\b",
+    r"\bremote (?:is )?not (?:possible|allowed|available)\b",
+    r"\b(?:pas de|sans) t[ée]l[ée]travail\b",
+    r"\bt[ée]l[ée]travail (?:non (?:autoris|possible|envisageable)|impossible|exclu)",
+]
+
+_WORK_MODE_RES = {m: re.compile("|".join(ps), re.IGNORECASE) for m, ps in WORK_MODE_PATTERNS.items()}
+_NO_REMOTE_RE = re.compile("|".join(NO_REMOTE_PATTERNS), re.IGNORECASE)
+_ANY_REMOTE_RE = re.compile(r"\b(?:remote|t[ée]l[ée]travail)\b", re.IGNORECASE)
+
+def work_mode(location: str, desc: str) -> str:
+    """REMOTE / HYBRID / ONSITE / UNSPECIFIED from the location plus explicit wording in the description."""
+    if _ANY_REMOTE_RE.search(location or ""):
+        return "REMOTE"
+    if _NO_REMOTE_RE.search(desc or ""):
+        return "ONSITE"
+    for mode, rx in _WORK_MODE_RES.items():
+        if rx.search(desc or ""):
+            return mode
+    # remote work mentioned without saying it is full-time -> some days remote
+    if _ANY_REMOTE_RE.search(desc or ""):
+        return "HYBRID"
+    return "ONSITE" if (location or "").strip() else "UNSPECIFIED"
+
+# role category -> keywords (whole words / phrases)
+ROLE_KEYWORDS = {
+    "DATA_AI": [
+        "data", "ml", "machine learning", "sql", "python", "spark",
+        "données", "deep learning", "intelligence artificielle",
+    ],
+    "SOFTWARE": [
+        "software", "frontend", "backend", "react", "java", "node", "golang",
+        "fullstack", "full stack", "devops", "développeur",
+    ],
+    "BUSINESS": [
+        "business", "analyst", "consultant", "product",
+        "business developer", "sales", "finance", "audit",
+    ],
+    "MARKETING": ["marketing", "seo", "growth", "communication", "brand"],
+}
+
+# matched case-sensitively: "AI" / "IA" count, the French "j'ai" / "vous ai" don't
+ROLE_ACRONYMS = {
+    "DATA_AI": ["AI", "IA", "NLP", "LLM"],
+}
+
+def _role_re(keywords, flags=0):
+    # longest first, so "machine learning" is one hit rather than a partial one
+    return re.compile(r"\b(?:" + "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)) + r")\b", flags)
+
+_ROLE_RES = {
+    r: [_role_re(ks, re.IGNORECASE)] + ([_role_re(ROLE_ACRONYMS[r])] if r in ROLE_ACRONYMS else [])
+    for r, ks in ROLE_KEYWORDS.items()
+}
+
+# a title hit outweighs this many description hits
+ROLE_TITLE_WEIGHT = 10
+
+def role_category(title: str, desc: str) -> str:
+    """Role with the most keyword hits (title hits weigh more), OTHER when none match."""
+    best, best_score = "OTHER", 0
+    for role, rxs in _ROLE_RES.items():
+        score = sum(ROLE_TITLE_WEIGHT * len(rx.findall(title or "")) + len(rx.findall(desc or "")) for rx in rxs)
+        if score > best_score:
+            best, best_score = role, score
+    return best
+
+# postcodes, arrondissements ("Paris 8e", "Lyon 3ème"), CEDEX, parenthesised notes
+_CITY_NOISE_RE = re.compile(
+    r"\(.*?\)|\b\d{5}\b|\b\d{1,2}\s?(?:e|er|ème|eme)\b|\bcedex\b|\barrondissement\b",
+    re.IGNORECASE,
+)
+_NOT_A_CITY = {"remote", "full remote", "télétravail", "teletravail", "france", "fr"}
+
+def normalize_city(location: str) -> Optional[str]:
+    """City part of a "City, Region, Country" location, cleaned up so one city has one spelling."""
+    city = _CITY_NOISE_RE.sub(" ", (location or "").split(",")[0])
+    city = re.sub(r"\s+", " ", city).strip(" -")
+    if not city or city.lower() in _NOT_A_CITY:
+        return None
+    if city.islower() or city.isupper():
+        city = city.title()
+    return city
+
+@lru_cache(maxsize=None)
+def _fingerprint(backend: str) -> str:
+    rules = {
+        "code": SCORING_CODE_VERSION,
+        "signals": {g: [ks, points] for g, (ks, points) in SIGNAL_GROUPS.items()},
+        "contracts": CONTRACT_GROUPS,
+        "work_mode": [WORK_MODE_PATTERNS, NO_REMOTE_PATTERNS],
+        "roles": [ROLE_KEYWORDS, ROLE_ACRONYMS, ROLE_TITLE_WEIGHT],
+        "city": [_CITY_NOISE_RE.pattern, sorted(_NOT_A_CITY)],
+        "lang": [backend, backend_rules(backend), LANG_SAMPLE_CHARS],
+    }
+    raw = json.dumps(rules, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def scoring_version() -> str:
+    """
+    Fingerprint of everything that decides a gold row (rule lists, points, language backend,
+    code version). Stored per gold row; rows with another version get re-scored.
+    """
+    return _fingerprint(get_language_backend())
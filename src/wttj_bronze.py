@@ -1,11 +1,23 @@
 import time
 import json
+import threading
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urlencode
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from typing import List, Set, Optional, Dict, Any, Tuple
+from typing import List, Set, Optional, Dict, Any, Tuple, Iterable, Iterator, NamedTuple
+
+from src.db import load_algolia_config, save_algolia_config, clear_algolia_config
 
 BASE = "https://www.welcometothejungle.com"
 
+# How long resolved Algolia credentials/index are reused before re-reading the /fr/jobs shell
+ALGOLIA_CONFIG_TTL_HOURS = 24.0
+
+# Algolia answers these when the cached key was rotated or the index renamed
+ALGOLIA_STALE_CODES = {401, 403, 404}
+
 HTML_HEADERS = {
     "User-Agent": "Mozilla/5.0",
     "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -23,11 +35,136 @@ ALLOWED_CONTRACT_TOKENS = {
     "trainee",
 }
 
+# ---------------------------
+# HTTP session + concurrent fetching
+# ---------------------------
+
+# Default pool size per host; fetch_many grows it to its worker count so threads don't wait on
+# sockets (and urllib3 doesn't discard connections that don't fit back into the pool).
+POOL_MAXSIZE = 16
+
+_session: Optional[requests.Session] = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+def _get_session(pool_maxsize: int = POOL_MAXSIZE) -> requests.Session:
+    """One shared Session (keep-alive connection pool) for every request we make."""
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_maxsize > _session_pool_size:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_size = pool_maxsize
+        return _session
+
+class _HostRateLimiter:
+    """Spaces out request starts per host (at most `per_host_rps` requests/second per host)."""
+
+    def __init__(self, per_host_rps: float):
+        self.min_interval = 1.0 / per_host_rps if per_host_rps and per_host_rps > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        if self.min_interval <= 0:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+class FetchResult(NamedTuple):
+    status: int                    # 200, or 304 when the cached copy is still valid
+    html: Optional[str]            # None on 304
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+# Algolia facet values for the contracts we keep (server-side version of ALLOWED_CONTRACT_TOKENS)
+TARGET_CONTRACT_FACETS = ["internship", "apprenticeship"]
+
+# Only the hit attributes _extract_url_hits / _is_target_contract actually read
+LISTING_ATTRIBUTES = [
+    "slug", "organization.slug", "organization.company_slug",
+    "contract_type", "name", "summary",
+    "public_url", "url", "website_url", "href", "path",
+]
+
+# Hit-first ingestion builds silver rows straight from hits, so it also needs the job content
+HIT_FIRST_ATTRIBUTES = LISTING_ATTRIBUTES + [
+    "organization.name", "offices", "description", "profile", "key_missions",
+    "remote", "language", "published_at",
+]
+
 def fetch(url: str) -> str:
-    r = requests.get(url, headers=HTML_HEADERS, timeout=30)
+    r = _get_session().get(url, headers=HTML_HEADERS, timeout=30)
     r.raise_for_status()
     return r.text
 
+def fetch_page(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+    """
+    Fetch a job page, revalidating with If-None-Match / If-Modified-Since when we have validators.
+    A 304 comes back as FetchResult(304, None, ...) so the caller keeps its stored copy.
+    """
+    headers = dict(HTML_HEADERS)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    r = _get_session().get(url, headers=headers, timeout=30)
+    new_etag = r.headers.get("ETag") or etag
+    new_lm = r.headers.get("Last-Modified") or last_modified
+    if r.status_code == 304:
+        return FetchResult(304, None, new_etag, new_lm)
+
+    r.raise_for_status()
+    return FetchResult(r.status_code, r.text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+
+def fetch_many(
+    urls: Iterable[str],
+    workers: int = 8,
+    per_host_rps: float = 5.0,
+    validators: Optional[Dict[str, Tuple[Optional[str], Optional[str]]]] = None,
+) -> Iterator[Tuple[str, Optional[FetchResult]]]:
+    """
+    Fetch many pages concurrently over the shared connection pool.
+    Yields (url, FetchResult) in completion order; the result is None when the fetch failed.
+    `validators` maps url -> (etag, last_modified) for conditional re-checks.
+    At most `workers` requests are in flight, and each host gets at most `per_host_rps` requests/second.
+    Only a bounded window of results is held at a time, so finished pages aren't kept for the whole run.
+    """
+    workers = max(1, workers)
+    _get_session(workers)
+    limiter = _HostRateLimiter(per_host_rps)
+    validators = validators or {}
+
+    def _one(url: str) -> Tuple[str, Optional[FetchResult]]:
+        limiter.wait(url)
+        etag, last_modified = validators.get(url, (None, None))
+        try:
+            return url, fetch_page(url, etag=etag, last_modified=last_modified)
+        except Exception:
+            return url, None
+
+    pending = iter(urls)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # keep the pool busy with a small queue, but don't submit (and hold results for) every url up front
+        in_flight = {ex.submit(_one, u) for _, u in zip(range(2 * workers), pending)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+                nxt = next(pending, None)
+                if nxt is not None:
+                    in_flight.add(ex.submit(_one, nxt))
+
 def _normalize_job_url(href: str) -> Optional[str]:
     if not href:
         return None
@@ -136,7 +273,7 @@ def _algolia_post(app_id: str, api_key: str, index: str, params: str, debug: boo
         "Accept": "application/json",
     }
 
-    r = requests.post(url, headers=headers, json={"params": params}, timeout=30)
+    r = _get_session().post(url, headers=headers, json={"params": params}, timeout=30)
     if debug:
         print(f"[WTTJ][algolia] POST index={index} -> {r.status_code}")
     if r.status_code != 200:
@@ -147,19 +284,47 @@ def _algolia_post(app_id: str, api_key: str, index: str, params: str, debug: boo
     except Exception:
         return 200, None
 
-def _find_working_index(app_id: str, api_key: str, indexes: List[str], debug: bool) -> Optional[str]:
+def _find_working_index(app_id: str, api_key: str, indexes: List[str], debug: bool, concurrency: int = 4) -> Optional[str]:
+    """Probe candidate indexes in parallel; the first working one in candidate order wins."""
     test_params = "query=&page=0&hitsPerPage=1"
-    for idx in indexes:
+
+    def _probe(idx: str) -> bool:
         code, data = _algolia_post(app_id, api_key, idx, test_params, debug=debug)
         if code != 200 or not isinstance(data, dict):
-            continue
+            return False
         hits = data.get("hits")
-        if isinstance(hits, list) and len(hits) > 0:
-            if debug:
-                print(f"[WTTJ][algolia] ✅ working index: {idx}")
-            return idx
+        return isinstance(hits, list) and len(hits) > 0
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        for idx, ok in zip(indexes, ex.map(_probe, indexes)):
+            if ok:
+                if debug:
+                    print(f"[WTTJ][algolia] ✅ working index: {idx}")
+                return idx
     return None
 
+def _listing_params(
+    page: int,
+    per_page: int,
+    server_filter: bool,
+    only_internships: bool,
+    attributes: List[str] = LISTING_ATTRIBUTES,
+) -> str:
+    """
+    Algolia query params for one listing page. With server_filter, the country (and contract type,
+    when only_internships) refinement runs inside Algolia and hits carry only the fields we read.
+    """
+    params: Dict[str, Any] = {"query": "", "page": page, "hitsPerPage": per_page}
+    if server_filter:
+        facet_filters: List[Any] = [["offices.country_code:FR"]]
+        if only_internships:
+            facet_filters.append([f"contract_type:{v}" for v in TARGET_CONTRACT_FACETS])
+        params["facetFilters"] = json.dumps(facet_filters)
+        params["attributesToRetrieve"] = json.dumps(attributes)
+        params["attributesToHighlight"] = "[]"
+        params["attributesToSnippet"] = "[]"
+    return urlencode(params)
+
 def _is_target_contract(hit: Dict[str, Any]) -> bool:
     """
     Filter Algolia hits to internships/alternance only.
@@ -199,8 +364,9 @@ def _build_url_from_hit(hit: Dict[str, Any]) -> Optional[str]:
 
     return f"{BASE}/fr/companies/{org_slug}/jobs/{job_slug}"
 
-def _extract_urls_from_hits(hits: List[Any], only_internships: bool = True) -> List[str]:
-    out: List[str] = []
+def _extract_url_hits(hits: List[Any], only_internships: bool = True) -> List[Tuple[str, Dict[str, Any]]]:
+    """(url, hit) for every job URL found in a page of hits, in hit order."""
+    out: List[Tuple[str, Dict[str, Any]]] = []
     seen = set()
 
     for h in hits:
@@ -216,7 +382,7 @@ def _extract_urls_from_hits(hits: List[Any], only_internships: bool = True) -> L
             norm = _normalize_job_url(built)
             if norm and norm not in seen:
                 seen.add(norm)
-                out.append(norm)
+                out.append((norm, h))
 
         # Also accept any direct url-ish fields if present
         for k in ["public_url", "url", "website_url", "href", "path"]:
@@ -225,11 +391,22 @@ def _extract_urls_from_hits(hits: List[Any], only_internships: bool = True) -> L
                 norm = _normalize_job_url(v)
                 if norm and norm not in seen:
                     seen.add(norm)
-                    out.append(norm)
+                    out.append((norm, h))
 
     return out
 
-def _list_urls_algolia(limit: int, max_pages: int, per_page: int, sleep_s: float, debug: bool, only_internships: bool) -> List[str]:
+def _resolve_algolia(debug: bool, concurrency: int, use_cache: bool) -> Optional[Tuple[str, str, str, bool]]:
+    """
+    (app_id, api_key, index, from_cache). Warm runs reuse the cached triple from jobs.sqlite;
+    cold runs download the /fr/jobs shell, read window.env and probe the candidate indexes.
+    """
+    if use_cache:
+        hit = load_algolia_config(ALGOLIA_CONFIG_TTL_HOURS)
+        if hit:
+            if debug:
+                print(f"[WTTJ][algolia] using cached config index={hit[2]}")
+            return hit[0], hit[1], hit[2], True
+
     shell = fetch(f"{BASE}/fr/jobs?refinementList%5Boffices.country_code%5D%5B%5D=FR")
     env = _extract_env_from_html(shell, debug=debug)
     app_id, api_key, indexes = _pick_algolia_config(env)
@@ -238,42 +415,103 @@ def _list_urls_algolia(limit: int, max_pages: int, per_page: int, sleep_s: float
         print(f"[WTTJ][algolia] app_id={app_id} api_key={'YES' if api_key else 'NO'} candidates={indexes[:8]}...")
 
     if not app_id or not api_key:
-        return []
+        return None
 
-    idx = _find_working_index(app_id, api_key, indexes, debug=debug)
+    idx = _find_working_index(app_id, api_key, indexes, debug=debug, concurrency=concurrency)
     if not idx:
         if debug:
             print("[WTTJ][algolia] ❌ no working index found")
+        return None
+
+    save_algolia_config(app_id, api_key, idx)
+    return app_id, api_key, idx, False
+
+def _list_hits_algolia(
+    limit: int,
+    max_pages: int,
+    per_page: int,
+    sleep_s: float,
+    debug: bool,
+    only_internships: bool,
+    concurrency: int = 4,
+    server_filter: bool = True,
+    attributes: List[str] = LISTING_ATTRIBUTES,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    resolved = _resolve_algolia(debug=debug, concurrency=concurrency, use_cache=True)
+    if not resolved:
         return []
+    app_id, api_key, idx, cached = resolved
+
+    # sleep_s between pages becomes a request-rate budget shared by the page workers
+    limiter = _HostRateLimiter(1.0 / sleep_s if sleep_s > 0 else 0)
+
+    def _page(page: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        limiter.wait(f"https://{app_id}-dsn.algolia.net")
+        params = _listing_params(page, per_page, server_filter, only_internships, attributes)
+        return _algolia_post(app_id, api_key, idx, params, debug=debug)
 
     seen: Set[str] = set()
-    urls: List[str] = []
+    urls: List[Tuple[str, Dict[str, Any]]] = []
 
-    for page in range(0, max_pages):
-        params = f"query=&page={page}&hitsPerPage={per_page}"
-        code, data = _algolia_post(app_id, api_key, idx, params, debug=debug)
+    def _take(page: int, code: int, data: Optional[Dict[str, Any]]) -> bool:
+        """Add one page's URLs in order; False means stop (error, empty page, or limit reached)."""
         if code != 200 or not isinstance(data, dict):
-            break
+            return False
 
         hits = data.get("hits")
         if not isinstance(hits, list) or len(hits) == 0:
-            break
+            return False
 
-        page_urls = _extract_urls_from_hits(hits, only_internships=only_internships)
+        # the local contract filter stays on as a safety net behind the server-side facetFilters
+        page_urls = _extract_url_hits(hits, only_internships=only_internships)
 
         added = 0
-        for u in page_urls:
+        for u, h in page_urls:
             if u not in seen:
                 seen.add(u)
-                urls.append(u)
+                urls.append((u, h))
                 added += 1
                 if len(urls) >= limit:
-                    return urls[:limit]
+                    return False
 
         if debug:
             print(f"[WTTJ][algolia] page={page} hits={len(hits)} urls_found={len(page_urls)} added={added} total={len(urls)}")
+        return True
 
-        time.sleep(sleep_s)
+    # page 0 tells us how many pages exist
+    code, first = _page(0)
+    if cached and code in ALGOLIA_STALE_CODES:
+        # cached key/index went stale: forget it, resolve from the shell again, retry once
+        if debug:
+            print(f"[WTTJ][algolia] cached config rejected ({code}), re-resolving")
+        clear_algolia_config()
+        resolved = _resolve_algolia(debug=debug, concurrency=concurrency, use_cache=False)
+        if not resolved:
+            return []
+        app_id, api_key, idx, cached = resolved
+        code, first = _page(0)
+
+    if server_filter and (code != 200 or not isinstance(first, dict) or not first.get("hits")):
+        # index doesn't accept these facets (or they match nothing): page through everything instead
+        if debug:
+            print(f"[WTTJ][algolia] server-side filter unusable ({code}), falling back to client-side filtering")
+        server_filter = False
+        code, first = _page(0)
+
+    if not _take(0, code, first):
+        return urls[:limit]
+
+    nb_pages = first.get("nbPages") if isinstance(first.get("nbPages"), int) else max_pages
+    last = min(max_pages, nb_pages)
+
+    # remaining pages in waves of `concurrency`, consumed in page order so results stay deterministic
+    step = max(1, concurrency)
+    with ThreadPoolExecutor(max_workers=step) as ex:
+        for start in range(1, last, step):
+            wave = list(range(start, min(start + step, last)))
+            for page, (code, data) in zip(wave, ex.map(_page, wave)):
+                if not _take(page, code, data):
+                    return urls[:limit]
 
     return urls[:limit]
 
@@ -321,6 +559,37 @@ def _list_urls_html(limit: int, max_pages: int, sleep_s: float, debug: bool) ->
 
     return urls[:limit]
 
+def _list_france(
+    limit: int,
+    max_pages: int,
+    per_page: int,
+    sleep_s: float,
+    debug: bool,
+    only_internships: bool,
+    concurrency: int,
+    server_filter: bool,
+    attributes: List[str],
+) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    pairs: List[Tuple[str, Optional[Dict[str, Any]]]] = list(_list_hits_algolia(
+        limit=limit,
+        max_pages=max_pages,
+        per_page=per_page,
+        sleep_s=sleep_s,
+        debug=debug,
+        only_internships=only_internships,
+        concurrency=concurrency,
+        server_filter=server_filter,
+        attributes=attributes,
+    ))
+    if len(pairs) >= 60:
+        return pairs[:limit]
+
+    if debug:
+        print("[WTTJ] Algolia gave too few URLs, falling back to HTML paging...")
+
+    urls = _list_urls_html(limit=limit, max_pages=max_pages, sleep_s=sleep_s, debug=debug)
+    return [(u, None) for u in urls]
+
 def wttj_list_urls_france(
     limit: int = 400,
     max_pages: int = 40,
@@ -328,19 +597,44 @@ def wttj_list_urls_france(
     sleep_s: float = 0.2,
     debug: bool = False,
     only_internships: bool = True,   # ✅ default ON
+    concurrency: int = 4,
+    server_filter: bool = True,
 ) -> List[str]:
-    urls = _list_urls_algolia(
+    pairs = _list_france(
         limit=limit,
         max_pages=max_pages,
         per_page=per_page,
         sleep_s=sleep_s,
         debug=debug,
         only_internships=only_internships,
+        concurrency=concurrency,
+        server_filter=server_filter,
+        attributes=LISTING_ATTRIBUTES,
     )
-    if len(urls) >= 60:
-        return urls[:limit]
+    return [u for u, _ in pairs]
 
-    if debug:
-        print("[WTTJ] Algolia gave too few URLs, falling back to HTML paging...")
-
-    return _list_urls_html(limit=limit, max_pages=max_pages, sleep_s=sleep_s, debug=debug)
+def wttj_list_hits_france(
+    limit: int = 400,
+    max_pages: int = 40,
+    per_page: int = 50,
+    sleep_s: float = 0.2,
+    debug: bool = False,
+    only_internships: bool = True,
+    concurrency: int = 4,
+    server_filter: bool = True,
+) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    Like wttj_list_urls_france, but keeps each job's Algolia hit (with content attributes)
+    next to its URL. The hit is None for URLs that came from the HTML fallback.
+    """
+    return _list_france(
+        limit=limit,
+        max_pages=max_pages,
+        per_page=per_page,
+        sleep_s=sleep_s,
+        debug=debug,
+        only_internships=only_internships,
+        concurrency=concurrency,
+        server_filter=server_filter,
+        attributes=HIT_FIRST_ATTRIBUTES,
+    )
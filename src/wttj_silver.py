@@ -1,6 +1,8 @@
+import html as htmllib
 import json
 import re
-from typing import Optional, Dict
+from html.parser import HTMLParser
+from typing import Optional, Dict, Any, List, Iterable
 
 from bs4 import BeautifulSoup
 
@@ -11,12 +13,9 @@ def _clean_text(s: str) -> str:
     return re.sub(r"\s+", " ", s).strip()
 
 
-def _parse_jsonld_jobposting(soup: BeautifulSoup) -> Optional[Dict]:
-    """Try to extract JobPosting from JSON-LD scripts if present."""
-    scripts = soup.find_all("script", attrs={"type": "application/ld+json"})
-    for sc in scripts:
+def _find_jobposting(raws: Iterable[str]) -> Optional[Dict]:
+    for raw in raws:
         try:
-            raw = sc.get_text(strip=True)
             if not raw:
                 continue
             data = json.loads(raw)
@@ -30,11 +29,166 @@ def _parse_jsonld_jobposting(soup: BeautifulSoup) -> Optional[Dict]:
     return None
 
 
-def parse_job_fields(html: str, url: str = "") -> dict:
+def _parse_jsonld_jobposting(soup: BeautifulSoup) -> Optional[Dict]:
+    """Try to extract JobPosting from JSON-LD scripts if present."""
+    scripts = soup.find_all("script", attrs={"type": "application/ld+json"})
+    return _find_jobposting(sc.get_text(strip=True) for sc in scripts)
+
+
+# ---------------------------
+# Fast path: no DOM tree
+# ---------------------------
+
+_JSONLD_RE = re.compile(
+    r"<script\b[^>]*\btype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>(.*?)</script\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _parse_jsonld_jobposting_fast(html: str) -> Optional[Dict]:
+    """Same as _parse_jsonld_jobposting, but pulls the script bodies with a regex instead of a parse tree."""
+    return _find_jobposting(m.group(1).strip() for m in _JSONLD_RE.finditer(html))
+
+
+class _TextExtractor(HTMLParser):
+    """Streams the visible text of a page (what soup.get_text() returns) without building a tree."""
+
+    SKIP = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            data = data.strip()
+            if data:
+                self.parts.append(data)
+
+
+def _page_text_fast(html: str) -> str:
+    p = _TextExtractor()
+    p.feed(html)
+    p.close()
+    return " ".join(p.parts)
+
+
+def _jobposting_fields(jp: Dict) -> Dict[str, str]:
+    title = jp.get("title") or ""
+
+    company = ""
+    org = jp.get("hiringOrganization") or {}
+    if isinstance(org, dict):
+        company = org.get("name") or ""
+
+    location = ""
+    loc = jp.get("jobLocation") or ""
+    if isinstance(loc, list) and loc:
+        loc = loc[0]
+    if isinstance(loc, dict):
+        addr = loc.get("address") or {}
+        if isinstance(addr, dict):
+            city = addr.get("addressLocality") or ""
+            region = addr.get("addressRegion") or ""
+            country = addr.get("addressCountry") or ""
+            parts = [p for p in [city, region, country] if p]
+            location = ", ".join(parts)
+
+    emp = jp.get("employmentType") or ""
+    contract = emp if isinstance(emp, str) else str(emp)
+
+    return {"title": title, "company": company, "location": location, "contract": contract}
+
+
+def _result(url: str, title: str, company: str, location: str, contract: str, description: str) -> dict:
+    return {
+        "url": url,
+        "source": "wttj",
+        "title": _clean_text(title),
+        "company": _clean_text(company),
+        "location": _clean_text(location),
+        "contract": _clean_text(contract),
+        "description": _clean_text(description),
+    }
+
+
+def _jobposting_description(jp: Dict) -> str:
+    """JSON-LD `description` is an HTML fragment (sometimes entity-escaped twice) -> plain text."""
+    desc = jp.get("description")
+    if not isinstance(desc, str) or not desc.strip():
+        return ""
+    if "&lt;" in desc:
+        desc = htmllib.unescape(desc)
+    return _page_text_fast(desc)
+
+
+# page chrome that never belongs to a job description
+_BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "nav", "header", "footer", "aside", "form", "button", "svg"]
+
+
+def _main_content_text(soup: BeautifulSoup) -> str:
+    """
+    Fallback when JSON-LD has no description: drop page chrome, then keep the container holding
+    the most paragraph/list text (the job body), instead of the whole page.
+    """
+    for tag in soup.find_all(_BOILERPLATE_TAGS):
+        tag.decompose()
+
+    scores: Dict[int, int] = {}
+    nodes: Dict[int, Any] = {}
+    for el in soup.find_all(["p", "li"]):
+        parent = el.parent
+        # a list item's container is the list's parent
+        if el.name == "li" and parent is not None and parent.name in ("ul", "ol"):
+            parent = parent.parent
+        if parent is None:
+            continue
+        scores[id(parent)] = scores.get(id(parent), 0) + len(el.get_text(" ", strip=True))
+        nodes[id(parent)] = parent
+
+    if scores:
+        best = nodes[max(scores, key=scores.get)]
+        text = best.get_text(" ", strip=True)
+        if text:
+            return text
+
+    body = soup.body or soup
+    return body.get_text(" ", strip=True)
+
+
+def parse_job_fields(html: str, url: str = "", fast: bool = True) -> dict:
     """
     Parse job page HTML -> structured fields (title/company/location/contract/description)
     url is optional so the pipeline won't crash if it calls parse_job_fields(html).
+
+    description is the job text only: JSON-LD `description` when present, otherwise the main
+    content block of the page (no nav/footer/cookie banner/related jobs).
+
+    fast=True reads JSON-LD with a regex and never builds a DOM; pages whose JSON-LD JobPosting
+    lacks a title, company or description go through the full BeautifulSoup parse.
     """
+    if fast:
+        jp = _parse_jsonld_jobposting_fast(html or "")
+        if jp:
+            f = _jobposting_fields(jp)
+            description = _jobposting_description(jp)
+            # the h1 / og:site_name / main-content fallbacks need the tree
+            if f["title"] and f["company"] and description:
+                return _result(url, description=description, **f)
+
+    return _parse_job_fields_full(html, url)
+
+
+def _parse_job_fields_full(html: str, url: str = "") -> dict:
     soup = BeautifulSoup(html or "", "html.parser")
 
     title = company = location = contract = ""
@@ -42,26 +196,9 @@ def parse_job_fields(html: str, url: str = "") -> dict:
 
     jp = _parse_jsonld_jobposting(soup)
     if jp:
-        title = jp.get("title") or ""
-
-        org = jp.get("hiringOrganization") or {}
-        if isinstance(org, dict):
-            company = org.get("name") or ""
-
-        loc = jp.get("jobLocation") or ""
-        if isinstance(loc, list) and loc:
-            loc = loc[0]
-        if isinstance(loc, dict):
-            addr = loc.get("address") or {}
-            if isinstance(addr, dict):
-                city = addr.get("addressLocality") or ""
-                region = addr.get("addressRegion") or ""
-                country = addr.get("addressCountry") or ""
-                parts = [p for p in [city, region, country] if p]
-                location = ", ".join(parts)
-
-        emp = jp.get("employmentType") or ""
-        contract = emp if isinstance(emp, str) else str(emp)
+        f = _jobposting_fields(jp)
+        title, company, location, contract = f["title"], f["company"], f["location"], f["contract"]
+        description = _jobposting_description(jp)
 
     # fallback: title
     if not title:
@@ -74,16 +211,69 @@ def parse_job_fields(html: str, url: str = "") -> dict:
         og = soup.find("meta", attrs={"property": "og:site_name"})
         company = (og.get("content") or "") if og else ""
 
-    # description: prefer readable text; avoid returning entire site garbage if possible
-    # (Still best-effort without site-specific selectors)
-    description = soup.get_text(" ", strip=True)
+    # fallback: description from the page's main content block
+    if not description:
+        description = _main_content_text(soup)
+
+    return _result(url, title, company, location, contract, description)
+
+
+# ---------------------------
+# Algolia hits (hit-first ingestion)
+# ---------------------------
+
+# Below this many characters a hit's description is treated as a teaser and the job page is fetched
+HIT_DESCRIPTION_MIN_CHARS = 400
+
+
+def _hit_text(v: Any) -> str:
+    """Hit fields are plain strings, HTML fragments or lists of either."""
+    if isinstance(v, list):
+        return " ".join(_hit_text(x) for x in v)
+    if not isinstance(v, str):
+        return ""
+    if "<" in v:
+        v = BeautifulSoup(v, "html.parser").get_text(" ", strip=True)
+    return _clean_text(v)
+
+
+def parse_hit_fields(hit: Dict[str, Any], url: str = "") -> dict:
+    """
+    Algolia job hit -> the same structured fields parse_job_fields returns for a job page.
+    """
+    org = hit.get("organization") or {}
+    company = org.get("name") if isinstance(org, dict) else ""
+
+    location = ""
+    offices = hit.get("offices") or []
+    if isinstance(offices, list) and offices and isinstance(offices[0], dict):
+        o = offices[0]
+        parts = [o.get("city"), o.get("state"), o.get("country_code") or o.get("country")]
+        location = ", ".join(p for p in parts if isinstance(p, str) and p)
+
+    ct = hit.get("contract_type")
+    contract = ", ".join(str(x) for x in ct if x) if isinstance(ct, list) else (ct or "")
+
+    parts: List[str] = []
+    for k in ("summary", "description", "key_missions", "profile"):
+        t = _hit_text(hit.get(k))
+        if t:
+            parts.append(t)
 
     return {
         "url": url,
         "source": "wttj",
-        "title": _clean_text(title),
-        "company": _clean_text(company),
+        "title": _clean_text(hit.get("name") or ""),
+        "company": _clean_text(company or ""),
         "location": _clean_text(location),
-        "contract": _clean_text(contract),
-        "description": _clean_text(description),
+        "contract": _clean_text(str(contract)),
+        "description": _clean_text(" ".join(parts)),
     }
+
+
+def hit_needs_page(fields: dict) -> bool:
+    """True when a hit's description is missing or looks truncated, so the job page must be fetched."""
+    desc = fields.get("description") or ""
+    if len(desc) < HIT_DESCRIPTION_MIN_CHARS:
+        return True
+    return desc.endswith("…") or desc.endswith("...")